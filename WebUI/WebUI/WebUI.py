@@ -1,6 +1,6 @@
 # -*- coding: utf-8 -*-
 # Imports classes needed to create Flask application
-from flask import Flask, request, url_for, render_template, send_file
+from flask import Flask, request, url_for, render_template, send_file, jsonify, abort
 
 # Creates the application with title name
 app = Flask(__name__)
@@ -21,87 +21,130 @@ from os.path import join
 from .definition_extractor import DefExtractor
 from .crawler import Crawler
 from .freq_hist import make_freq_hist
+from .corpus_registry import CorpusRegistry
+
+# Dictionary corresponding filnames to title numbers
+TITLENUM = {
+    'usc01': '1',
+    'usc02': '2',
+    'usc03': '3',
+    'usc04': '4',
+    'usc05': '5',
+    'usc05A': '5a',
+    'usc06': '6',
+    'usc07': '7',
+    'usc08': '8',
+    'usc09': '9',
+    'usc10': '10',
+    'usc11': '11',
+    'usc11A': '11a',
+    'usc12': '12',
+    'usc13': '13',
+    'usc14': '14',
+    'usc15': '15',
+    'usc16': '16',
+    'usc17': '17',
+    'usc18': '18',
+    'usc18A': '18a',
+    'usc19': '19',
+    'usc20': '20',
+    'usc21': '21',
+    'usc22': '22',
+    'usc23': '23',
+    'usc24': '24',
+    'usc25': '25',
+    'usc26': '26',
+    'usc27': '27',
+    'usc28': '28',
+    'usc28A': '28a',
+    'usc29': '29',
+    'usc30': '30',
+    'usc31': '31',
+    'usc32': '32',
+    'usc33': '33',
+    'usc35': '35',
+    'usc36': '36',
+    'usc37': '37',
+    'usc38': '38',
+    'usc39': '39',
+    'usc40': '40',
+    'usc41': '41',
+    'usc42': '42',
+    'usc43': '43',
+    'usc44': '44',
+    'usc45': '45',
+    'usc46': '46',
+    'usc47': '47',
+    'usc48': '48',
+    'usc49': '49',
+    'usc50': '50',
+    'usc50A': '50a',
+    'usc51': '51',
+    'usc52': '52',
+    'usc54': '54',
+}
+
+# Maximum number of parsed law codes kept in memory, and law codes parsed at startup
+# (comma separated, e.g. "usc26,usc51")
+app.config['CORPUS_MAX_TITLES'] = int(
+    os.environ.get('WEBUI_CORPUS_MAX_TITLES', 4))
+app.config['CORPUS_PRELOAD_TITLES'] = [
+    lawcode
+    for lawcode in os.environ.get('WEBUI_CORPUS_PRELOAD_TITLES', '').split(',')
+    if lawcode
+]
+
+
+# Parses the xml file of the given law code, only called by the registry on a miss.
+# The crawler reads the title number from the document itself. Only the law codes of
+# TITLENUM are loaded, the law code is part of the file path.
+def load_crawler(lawcode):
+    if lawcode not in TITLENUM:
+        raise ValueError(u"Unknown law code: {0}".format(lawcode))
+    xml_filepath = join(app.root_path, 'xml_files/{0}.xml'.format(lawcode))
+    return Crawler(xml_filepath)
+
+
+# Shared by all requests (and threads) of this process
+registry = CorpusRegistry(
+    load_crawler, max_titles=app.config['CORPUS_MAX_TITLES'])
+for lawcode in app.config['CORPUS_PRELOAD_TITLES']:
+    if lawcode not in TITLENUM:
+        print(u"Warning: Not preloading unknown law code {0}".format(lawcode))
+registry.preload([
+    lawcode for lawcode in app.config['CORPUS_PRELOAD_TITLES']
+    if lawcode in TITLENUM
+])
 
 
 # Creates the parsing function of the app that received information from the form and posts
 # information from the parser
 @app.route('/parse', methods=['GET', 'POST'])
 def parse():
-    # Sets appropriate level id and xml filepath based on the inputs from the web form
+    # Sets appropriate law code and level id based on the inputs from the web form
     lawcode = request.form.get("lawcode")
-    xml_filepath = join(app.root_path, 'xml_files/{0}.xml'.format(lawcode))
     levelid = "s" + request.form.get("levelid")
-    # Dictionary corresponding filnames to title numbers
-    titlenum = {
-        'usc01': '1',
-        'usc02': '2',
-        'usc03': '3',
-        'usc04': '4',
-        'usc05': '5',
-        'usc05A': '5a',
-        'usc06': '6',
-        'usc07': '7',
-        'usc08': '8',
-        'usc09': '9',
-        'usc10': '10',
-        'usc11': '11',
-        'usc11A': '11a',
-        'usc12': '12',
-        'usc13': '13',
-        'usc14': '14',
-        'usc15': '15',
-        'usc16': '16',
-        'usc17': '17',
-        'usc18': '18',
-        'usc18A': '18a',
-        'usc19': '19',
-        'usc20': '20',
-        'usc21': '21',
-        'usc22': '22',
-        'usc23': '23',
-        'usc24': '24',
-        'usc25': '25',
-        'usc26': '26',
-        'usc27': '27',
-        'usc28': '28',
-        'usc28A': '28a',
-        'usc29': '29',
-        'usc30': '30',
-        'usc31': '31',
-        'usc32': '32',
-        'usc33': '33',
-        'usc35': '35',
-        'usc36': '36',
-        'usc37': '37',
-        'usc38': '38',
-        'usc39': '39',
-        'usc40': '40',
-        'usc41': '41',
-        'usc42': '42',
-        'usc43': '43',
-        'usc44': '44',
-        'usc45': '45',
-        'usc46': '46',
-        'usc47': '47',
-        'usc48': '48',
-        'usc49': '49',
-        'usc50': '50',
-        'usc50A': '50a',
-        'usc51': '51',
-        'usc52': '52',
-        'usc54': '54',
-    }
+    # Unknown law codes are rejected before the registry loads (and caches) anything
+    if lawcode not in TITLENUM:
+        abort(400)
     try:
-        crawl = Crawler(xml_filepath, titlenum[lawcode])
+        # Reuses the parsed law code if an earlier request already loaded it
+        crawl = registry.get(lawcode)
         make_freq_hist(crawl,
-                       crawl.get_level(levelid), titlenum[lawcode], levelid)
+                       crawl.get_level(levelid), TITLENUM[lawcode], levelid)
         words = DefExtractor().main(crawl, levelid)
         return render_template(
             'show_definitions.html',
             ans=words,
-            title=titlenum[lawcode],
+            title=TITLENUM[lawcode],
             level=levelid)
     # Handles errors from executing the code above
     except Exception as e:
         # Displays the error page that properly prints the given error
         return render_template('error.html', err=e)
+
+
+# Returns the registered law codes and the registry hit/miss/eviction counters
+@app.route('/registry')
+def registry_stats():
+    return jsonify(registry.stats())
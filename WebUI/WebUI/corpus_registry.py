@@ -0,0 +1,70 @@
+import threading
+from collections import OrderedDict
+
+
+# Keeps parsed law code crawlers alive between requests, so that each title is only
+# parsed once per process instead of once per request
+class CorpusRegistry:
+    # Instantiates the registry, loader(lawcode) should return the crawler for a law code
+    # and at most max_titles crawlers are kept, least recently used ones are evicted first
+    def __init__(self, loader, max_titles=4):
+        assert max_titles > 0
+        self.loader = loader
+        self.max_titles = max_titles
+        # Crawlers in least to most recently used order
+        self._crawlers = OrderedDict()
+        # One lock per law code being loaded, so concurrent misses only parse once
+        self._loading = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # Returns the crawler for the given law code, parsing it only if it isn't registered
+    def get(self, lawcode):
+        with self._lock:
+            if lawcode in self._crawlers:
+                self.hits += 1
+                self._crawlers.move_to_end(lawcode)
+                return self._crawlers[lawcode]
+            self.misses += 1
+            loading_lock = self._loading.setdefault(lawcode, threading.Lock())
+        # Parses outside of the registry lock so other titles stay available
+        with loading_lock:
+            with self._lock:
+                # Another request may have loaded it while we were waiting
+                if lawcode in self._crawlers:
+                    self._crawlers.move_to_end(lawcode)
+                    return self._crawlers[lawcode]
+            try:
+                crawler = self.loader(lawcode)
+                with self._lock:
+                    self._crawlers[lawcode] = crawler
+                    while len(self._crawlers) > self.max_titles:
+                        self._crawlers.popitem(last=False)
+                        self.evictions += 1
+            finally:
+                # Also when the loader raises, so a later request tries again
+                with self._lock:
+                    self._loading.pop(lawcode, None)
+        return crawler
+
+    # Loads the given law codes ahead of the first request, a law code that fails to load
+    # is skipped so that the app still starts, and is loaded again on its first request
+    def preload(self, lawcodes):
+        for lawcode in lawcodes:
+            try:
+                self.get(lawcode)
+            except Exception as e:
+                print(u"Warning: Unable to preload law code {0}: {1!r}".format(lawcode, e))
+
+    # Returns the registered law codes and the hit/miss/eviction counters
+    def stats(self):
+        with self._lock:
+            return {
+                "titles": list(self._crawlers.keys()),
+                "max_titles": self.max_titles,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
@@ -141,21 +141,53 @@ class Level:
         return str(self).encode("UTF-8")
 
 
+# Identifiers of the documents of the United States Code, e.g. "/us/usc/t26". This and
+# get_document_identifier are kept in step with scripts/section_index.py on purpose: the
+# scripts run on Python 2 and the WebUI on Python 3, so they can't import each other.
+USC_DOCUMENT_IDENTIFIER_PREFIX = u"/us/usc/t"
+
+
+# Returns the identifier of a document, e.g. "/us/usc/t26", some documents have no
+# identifier and only a number in their metadata
+def get_document_identifier(root):
+    identifier = root.get("identifier")
+    if identifier is None:
+        namespace = etree.QName(root).namespace
+        doc_number = root.find("{{{0}}}meta/{{{0}}}docNumber".format(namespace))
+        if doc_number is not None:
+            identifier = USC_DOCUMENT_IDENTIFIER_PREFIX + doc_number.text.strip()
+    return identifier
+
+
+# Returns the title number of a document identifier, e.g. "/us/usc/t26" => "26"
+def get_titlenum(document_identifier):
+    assert document_identifier is not None and document_identifier.startswith(
+        USC_DOCUMENT_IDENTIFIER_PREFIX), u"Unknown document: {0}".format(
+            document_identifier)
+    return document_identifier[len(USC_DOCUMENT_IDENTIFIER_PREFIX):]
+
+
 # Defines crawler class that parses through the xml file
 class Crawler:
-    # Instantiates the crawler class using given xml filepath
+    # Instantiates the crawler class using given xml filepath, the title number is read
+    # from the identifier of the document unless it is given
     def __init__(self,
                  xml_filepath,
-                 titlenum,
+                 titlenum=None,
                  default_namespace="USLM",
                  debug=False):
+        self.xml_filepath = xml_filepath
         self.tree = etree.parse(xml_filepath)
         self.root = self.tree.getroot()
         self.default_namespace = default_namespace
         self.nsmap = self.root.nsmap
         self.nsmap[default_namespace] = self.nsmap.pop(None)
         self.debug = debug
+        if titlenum is None:
+            titlenum = get_titlenum(get_document_identifier(self.root))
         self.titlenum = titlenum
+        # Maps identifiers to their nodes, built on the first lookup
+        self._level_node_index = None
 
     # Returns default namespace prefix
     def _namespace_prefix(self):
@@ -171,14 +203,26 @@ class Crawler:
                            encoding="UTF-8").strip().decode("UTF-8"),
             flags=re.UNICODE)
 
+    # Walks the tree once and maps each identifier to the nodes that carry it,
+    # so lookups don't have to scan the whole xml file every time
+    def _build_level_node_index(self):
+        index = dict()
+        for node in self.root.iter("{0}*".format(self._namespace_prefix())):
+            identifier = node.get("identifier")
+            if identifier is not None:
+                index.setdefault(identifier, []).append(node)
+        return index
+
     # Gets the node based on its level id and xml filepath
     def _get_level_node(self, level_id):
         # Makes sure given level id is a valid LevelId object
         assert isinstance(level_id, LevelId)
-        # Filepath of level given titlenum and level id
-        xpath_expression = "//{0}:*[@identifier='/us/usc/t{1}/{2}']".format(
-            self.default_namespace, self.titlenum, level_id)
-        nodes = self.root.xpath(xpath_expression, namespaces=self.nsmap)
+        # Builds the identifier index on the first lookup
+        if self._level_node_index is None:
+            self._level_node_index = self._build_level_node_index()
+        # Identifier of level given titlenum and level id
+        nodes = self._level_node_index.get(
+            u"/us/usc/t{0}/{1}".format(self.titlenum, level_id), [])
         # Makes sure this is a unique node
         assert len(nodes) <= 1
         # If there are no nodes with the given id, raise exception
@@ -15,6 +15,16 @@ TERM_REGEX = re.compile(
     r"(?:(“[^”]+”)|(‘[^’]+’)) (?:{0})".format(u"|".join(DEFINITION_TYPES)),
     re.UNICODE | re.IGNORECASE)
 
+# Regular expression pattern for finding the definitions of all terms in one scan, the
+# lookahead is empty so that overlapping definitions are found too
+DEFINITION_REGEX = re.compile(
+    r"(?=(?:“([^”]+)”|‘([^’]+)’) ({0}))".format(u"|".join(DEFINITION_TYPES)),
+    re.UNICODE | re.IGNORECASE)
+
+# Terms with these characters are patterns in get_term_regex, or can't be told apart from
+# their quotes by DEFINITION_REGEX, so they are still searched on their own
+SPECIAL_TERM_CHARACTERS = set(u".^$*+?{}[]\\|()“”‘’\n")
+
 
 # Declares DefExtractor class, originally definition_extractor.py
 # This is because Flask makes it complicated to import classes from other python files,
@@ -29,7 +39,10 @@ class DefExtractor:
     # Uses term regex to find and keep a list of defined terms
     def extract_defined_terms(self, level):
         # Puts a new line between each sentence
-        text = u'\n'.join(level.get_sentences())
+        return self.find_defined_terms(u'\n'.join(level.get_sentences()))
+
+    # Returns the defined terms of a text, in order of appearance
+    def find_defined_terms(self, text):
         # Makes array of defined terms
         defined_terms = []
         # Finds all terms that match regex for key terms
@@ -52,21 +65,61 @@ class DefExtractor:
         # Returns the array of defined terms
         return defined_terms
 
+    # Returns the (type, rest) matches of each term defined in the sentence, the same as
+    # get_term_regex(term).findall(sentence) for each term but with one scan of the sentence.
+    # terms_by_lowercase maps each lowercase term to the terms equal to it ignoring case
+    def find_term_definitions(self, sentence, terms_by_lowercase, special_terms):
+        matches = dict()
+        # Where the (.*) of the last definition of each term stops, findall skips anything
+        # before that
+        line_ends = dict()
+        for match in DEFINITION_REGEX.finditer(sentence):
+            quoted_term = match.group(1) if match.group(1) is not None else match.group(2)
+            terms = terms_by_lowercase.get(quoted_term.lower())
+            if terms is None:
+                continue
+            start = match.start()
+            line_end = sentence.find(u"\n", match.end(3))
+            if line_end == -1:
+                line_end = len(sentence)
+            for term in terms:
+                if line_ends.get(term, -1) > start:
+                    continue
+                line_ends[term] = line_end
+                matches.setdefault(term, []).append(
+                    (match.group(3), sentence[match.end(3):line_end]))
+        # Special terms are still searched with their own pattern
+        for term in special_terms:
+            term_matches = self.get_term_regex(term).findall(sentence)
+            if len(term_matches) > 0:
+                matches[term] = term_matches
+        return matches
+
     # Finds and stores all the definitions of key terms
     def extract_definitions(self, level):
         # Gets all unique defined terms from given level id
         defined_terms = self.extract_defined_terms(level)
         unique_terms = set(defined_terms)
+        # Definitions of a sentence are added in the iteration order of the set, as they were
+        # when each term was searched on its own
+        term_positions = dict((term, i) for i, term in enumerate(unique_terms))
+        terms_by_lowercase = dict()
+        special_terms = []
+        for term in unique_terms:
+            if len(SPECIAL_TERM_CHARACTERS.intersection(term)) > 0:
+                special_terms.append(term)
+            else:
+                terms_by_lowercase.setdefault(term.lower(), []).append(term)
         # Makes an ordered dictionary called definitions
         definitions = OrderedDict()
         # Parses all the sentences in the level and stores them in array sentences
         sentences = level.get_sentences()
         # Finds all the sentences that fit a definition regex pattern and stores them in definitions
         for sentence in sentences:
-            for term in unique_terms:
-                term_def_regex = self.get_term_regex(term)
-                matches = term_def_regex.findall(sentence)
-                if len(matches) == 0: continue
+            sentence_matches = self.find_term_definitions(
+                sentence, terms_by_lowercase, special_terms)
+            for term in sorted(sentence_matches, key=term_positions.get):
+                matches = sentence_matches[term]
                 assert len(matches) == 1
                 def_type, rest = matches[0]
                 assert def_type in DEFINITION_TYPES
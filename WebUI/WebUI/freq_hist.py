@@ -2,6 +2,8 @@
 # from irc_crawler import IRCCrawler
 from .crawler import Crawler, Level
 from .definition_extractor import DefExtractor
+from .term_index import get_term_index
+from .term_counter import count_terms
 import matplotlib.pyplot as plt
 import numpy as np
 import operator
@@ -17,15 +19,10 @@ def make_freq_hist(crawl, level, title, levelid):
         title, levelid))
     extractor = DefExtractor()
     text = u'\n'.join(level.get_sentences())
-    num_defined_terms = []
     defined_terms = extractor.extract_defined_terms(level)
-    for x in defined_terms:
-        p = text.count(x)  # find the terms in text
-        num_defined_terms.append(
-            p)  # add a number to a list called num_defined_terms
-    dictionary = dict(
-        zip(defined_terms,
-            num_defined_terms))  # match the defined term to their frequencies
+    dictionary = count_terms(
+        text, defined_terms
+    )  # match the defined term to their frequencies, in one pass over the text
     sorteddict = sorted(
         dictionary.items(), key=operator.itemgetter(
             1))  # turn into tuple, sort by value(1) rather than key(0)
@@ -44,24 +41,10 @@ def make_freq_hist(crawl, level, title, levelid):
     section_words = list(
         section_count.keys())  # the words pertaining to each frequency
 
-    # os.chdir('definition_stats')
-    # file_object = open('defined_terms.txt', 'r')
-    # irc = file_object.readlines()
-    keyterms = []
-    for section in crawl.iterate_over_sections():
-        keyterms.extend(extractor.extract_defined_terms(section))
-    # irc_count = collections.Counter(irc)
-    term_count = collections.Counter(keyterms)
-    # irc_freq = irc_count.values()  # the frequencies themselves
-    term_freq = list(term_count.values())
-    # irc_words = irc_count.keys()  # the words pertaining to each frequency
-    term_words = list(term_count.keys())
+    # Number of definitions of each term in the whole title, from the term index
+    term_index = get_term_index(crawl)
     for index, word in enumerate(section_words, start=0):
-        # target = word + '\n'
-        target_index = list(term_words).index(
-            word)  # indexes of each defined word.
-        section_index = list(section_words).index(word)
-        if term_freq[target_index] > section_freq[section_index]:
+        if term_index.get_count(word) > section_freq[index]:
             kword = section_words[index]
             realindex = keys.index(kword)
             colors[realindex] = 'g'
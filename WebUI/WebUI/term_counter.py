@@ -0,0 +1,108 @@
+# This Python file uses the following encoding: UTF-8
+import re
+from collections import Counter, OrderedDict
+
+
+# Trie of a set of terms, e.g. the defined terms of a level, compiled to a single regular
+# expression so that the occurrences of all terms, overlapping ones included, are found
+# in one pass over a text instead of one text.count per term. Same as
+# scripts/term_counter.py
+class TermCounter:
+    # Builds the trie and its regex, with ignore_case terms and text are compared
+    # lowercased
+    def __init__(self, terms, ignore_case=False):
+        self.ignore_case = ignore_case
+        # Unique non-empty terms, in order of first appearance
+        self.terms = list(OrderedDict.fromkeys(t for t in terms if len(t) > 0))
+        # Trie transitions of each state, state 0 is the root
+        self._goto = [dict()]
+        # Indices of the terms ending at each state
+        self._outputs = [[]]
+        for term_index, term in enumerate(self.terms):
+            state = 0
+            for c in self._normalize(term):
+                next_state = self._goto[state].get(c)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][c] = next_state
+                    self._goto.append(dict())
+                    self._outputs.append([])
+                state = next_state
+            self._outputs[state].append(term_index)
+        # Maps each normalized term to the indices of the terms it starts with, shortest
+        # first
+        self._prefix_outputs = dict()
+        stack = [(0, u"", [])]
+        while stack:
+            state, prefix, outputs = stack.pop()
+            if self._outputs[state]:
+                outputs = outputs + self._outputs[state]
+                self._prefix_outputs[prefix] = outputs
+            for c, next_state in self._goto[state].items():
+                stack.append((next_state, prefix + c, outputs))
+        if len(self.terms) > 0:
+            self._regex = re.compile(self._get_pattern(0), re.UNICODE)
+        else:
+            self._regex = None
+
+    # Lowercases the text if the case is ignored
+    def _normalize(self, text):
+        return text.lower() if self.ignore_case else text
+
+    # Returns the pattern of the terms below the state, one alternative per child. Chains
+    # of states with a single child and no term are merged into one literal, optional
+    # groups are greedy so the longest term wins
+    def _get_pattern(self, state):
+        branches = []
+        for c, next_state in sorted(self._goto[state].items()):
+            literal = c
+            while not self._outputs[next_state] and len(
+                    self._goto[next_state]) == 1:
+                c, next_state = next(iter(self._goto[next_state].items()))
+                literal += c
+            branches.append(re.escape(literal) + self._get_pattern(next_state))
+        if len(branches) == 0:
+            return u""
+        pattern = u"(?:{0})".format(u"|".join(branches))
+        if self._outputs[state]:
+            pattern += u"?"
+        return pattern
+
+    # Yields (start position, term) of each occurrence, ordered by start position then
+    # length. The regex finds the next position where a term starts and matches the
+    # longest one, the shorter terms starting there are its prefixes in the trie
+    def iterate_over_matches(self, text):
+        if self._regex is None:
+            return
+        terms = self.terms
+        prefix_outputs = self._prefix_outputs
+        search = self._regex.search
+        text = self._normalize(text)
+        position = 0
+        while True:
+            match = search(text, position)
+            if match is None:
+                break
+            start = match.start()
+            for term_index in prefix_outputs[match.group()]:
+                yield start, terms[term_index]
+            # Terms may also start inside the match
+            position = start + 1
+
+    # Returns term => start positions of its occurrences, for every term
+    def find(self, text):
+        positions = OrderedDict((term, []) for term in self.terms)
+        for start, term in self.iterate_over_matches(text):
+            positions[term].append(start)
+        return positions
+
+    # Returns term => number of occurrences, for every term
+    def count(self, text):
+        counts = Counter(dict.fromkeys(self.terms, 0))
+        counts.update(term for _, term in self.iterate_over_matches(text))
+        return counts
+
+
+# Counts the occurrences of the terms in the text in one pass
+def count_terms(text, terms, ignore_case=False):
+    return TermCounter(terms, ignore_case=ignore_case).count(text)
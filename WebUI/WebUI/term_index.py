@@ -0,0 +1,213 @@
+# This Python file uses the following encoding: UTF-8
+import os
+import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict
+from .definition_extractor import DefExtractor
+
+# Bumped whenever the layout of the index file changes
+TERM_INDEX_FORMAT_VERSION = 1
+
+
+# Returns the path of the term index of an xml file, kept next to it
+def get_term_index_filepath(xml_filepath):
+    return "{0}.termindex".format(xml_filepath)
+
+
+# Returns the sha1 of a file, read in blocks
+def hash_file(filepath):
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+# Returns what identifies the current version of an xml file
+def get_source_info(xml_filepath):
+    stat = os.stat(xml_filepath)
+    return {
+        "xml_hash": hash_file(xml_filepath),
+        "xml_size": stat.st_size,
+        "xml_mtime": stat.st_mtime
+    }
+
+
+# Checks whether the xml file is the one described by the source info, the hash is
+# only computed when the size or modification time differ
+def is_source_unchanged(data, xml_filepath):
+    stat = os.stat(xml_filepath)
+    if data.get("xml_size") != stat.st_size:
+        return False
+    if data.get("xml_mtime") == stat.st_mtime:
+        return True
+    return data.get("xml_hash") == hash_file(xml_filepath)
+
+
+# Returns the hash of the ids, headings and text of a level and its sublevels, the
+# terms of the level only depend on them
+def get_content_hash(level):
+    sha1 = hashlib.sha1()
+    levels = [level]
+    while len(levels) > 0:
+        sublevel = levels.pop()
+        sha1.update(u"{0}\n{1}\n".format(sublevel.id,
+                                           sublevel.heading).encode("UTF-8"))
+        levels.extend(c[0] for c in sublevel.sublevels.values())
+    sha1.update(u'\n'.join(level.get_sentence_fragments()).encode("UTF-8"))
+    return sha1.hexdigest()
+
+
+# Returns the defined terms of a section and the (level id, term) of each definition
+# found in the own text of one of its levels
+def get_section_terms(extractor, section):
+    defining_levels = []
+    levels = [section]
+    while len(levels) > 0:
+        level = levels.pop()
+        texts = [level.heading, level.chapeau, level.content]
+        texts.extend(c[1] for c in level.sublevels.values())
+        texts.append(level.continuation)
+        for text in texts:
+            if text is None:
+                continue
+            for term in extractor.find_defined_terms(text):
+                defining_levels.append((str(level.id), term))
+        # Sublevels are pushed in reverse so that levels are visited in document order
+        levels.extend(c[0] for c in reversed(list(level.sublevels.values())))
+    return extractor.extract_defined_terms(section), defining_levels
+
+
+# Keeps, for each defined term, its number of definitions in the whole title and per
+# section and the levels defining it, so that histograms don't have to extract the
+# defined terms of every section on each request
+class TermIndex:
+    # Instantiates the index from [section id, content hash, defined terms,
+    # defining levels] of every section, in document order
+    def __init__(self, sections):
+        self.sections = sections
+        self._counts = Counter()
+        self._section_counts = dict()
+        self._defining_levels = dict()
+        for section_id, _, defined_terms, defining_levels in sections:
+            for term in defined_terms:
+                self._counts[term] += 1
+                section_counts = self._section_counts.setdefault(
+                    term, OrderedDict())
+                section_counts[section_id] = section_counts.get(
+                    section_id, 0) + 1
+            for level_id, term in defining_levels:
+                levels = self._defining_levels.setdefault(term, [])
+                # Lists a level once even if it defines the term several times
+                if len(levels) == 0 or levels[-1] != level_id:
+                    levels.append(level_id)
+
+    # Extracts the defined terms of every section of the crawler, the terms of sections
+    # whose content is unchanged since the previous index are reused
+    @staticmethod
+    def build(crawler, previous_sections=[]):
+        extractor = DefExtractor()
+        previous_terms = dict()
+        for section_id, content_hash, defined_terms, defining_levels in previous_sections:
+            previous_terms[(section_id, content_hash)] = (defined_terms,
+                                                          defining_levels)
+        sections = []
+        for section in crawler.iterate_over_sections():
+            section_id = section.id.get_section_id()
+            content_hash = get_content_hash(section)
+            terms = previous_terms.get((section_id, content_hash))
+            if terms is None:
+                terms = get_section_terms(extractor, section)
+            sections.append([
+                section_id, content_hash, list(terms[0]),
+                [list(t) for t in terms[1]]
+            ])
+        return TermIndex(sections)
+
+    # Reads the index file of an xml file, returns None if it is missing or unreadable
+    @staticmethod
+    def _load(xml_filepath):
+        filepath = get_term_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'r', encoding="UTF-8") as f:
+            try:
+                data = json.load(f)
+            except ValueError:
+                return None
+        if data.get("format") != TERM_INDEX_FORMAT_VERSION:
+            return None
+        return data
+
+    # Returns the index of an xml file, or None if there is none or the xml file changed
+    # since it was built
+    @staticmethod
+    def open(xml_filepath):
+        data = TermIndex._load(xml_filepath)
+        if data is None or not is_source_unchanged(data, xml_filepath):
+            return None
+        return TermIndex(data["sections"])
+
+    # Returns the index of the crawler's xml file, the index of an older version of the
+    # file is updated instead of being built from scratch
+    @staticmethod
+    def load_or_build(crawler):
+        data = TermIndex._load(crawler.xml_filepath)
+        if data is not None and is_source_unchanged(data, crawler.xml_filepath):
+            return TermIndex(data["sections"])
+        previous_sections = [] if data is None else data["sections"]
+        index = TermIndex.build(crawler, previous_sections=previous_sections)
+        try:
+            index.save(crawler.xml_filepath)
+        except (IOError, OSError) as e:
+            print(u"Warning: Unable to write term index: {0}".format(e))
+        return index
+
+    # Writes the index next to the xml file, through a temporary file so that readers
+    # never see a partial index
+    def save(self, xml_filepath):
+        data = get_source_info(xml_filepath)
+        data["format"] = TERM_INDEX_FORMAT_VERSION
+        data["sections"] = self.sections
+        filepath = get_term_index_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'w', encoding="UTF-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_filepath, filepath)
+
+    def __contains__(self, term):
+        return term in self._counts
+
+    # Returns the defined terms
+    def terms(self):
+        return list(self._counts.keys())
+
+    # Returns the number of definitions of the term in the whole title
+    def get_count(self, term):
+        return self._counts.get(term, 0)
+
+    # Returns section id => number of definitions of the term, in document order
+    def get_section_counts(self, term):
+        return self._section_counts.get(term, OrderedDict())
+
+    # Returns the ids of the levels whose own text defines the term, in document order
+    def get_defining_levels(self, term):
+        return self._defining_levels.get(term, [])
+
+
+# Guards _term_index_locks
+_term_index_locks_lock = threading.Lock()
+# XML file path => lock guarding the creation of its term index, so that building the
+# index of one title does not hold up requests for another
+_term_index_locks = dict()
+
+
+# Returns the term index of a crawler, loaded or built once and kept on the crawler
+def get_term_index(crawler):
+    with _term_index_locks_lock:
+        lock = _term_index_locks.setdefault(crawler.xml_filepath, threading.Lock())
+    with lock:
+        if getattr(crawler, "_term_index", None) is None:
+            crawler._term_index = TermIndex.load_or_build(crawler)
+        return crawler._term_index
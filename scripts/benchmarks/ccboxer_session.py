@@ -0,0 +1,79 @@
+import json
+import threading
+import timeit
+import BaseHTTPServer
+from SocketServer import ThreadingMixIn
+import requests
+from ..candc_boxer_api import CCBoxerAPI
+
+SENTENCE = u"The term \"qualified residence\" means the principal residence of the taxpayer."
+
+
+class StandInHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    # Answers every request like the C&C/Boxer server, with an empty parse,
+    # and keeps the connection open. The response is sent in one write, else
+    # Nagle's algorithm holds back the body of a kept-alive response.
+    protocol_version = "HTTP/1.1"
+    wbufsize = -1
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.getheader("Content-Length", 0)))
+        body = json.dumps({"out": "", "err": ""})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class StandInServer(ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def send_without_session(url, payload):
+    # Request as sent before the session, one new connection per sentence
+    response = requests.post(url, data=payload.encode("UTF-8"), headers={'Content-type': 'text/plain; charset=UTF-8'})
+    response.raise_for_status()
+    return response.json()
+
+def time_sentences(send, num_sentences):
+    # Mean seconds per sentence
+    start = timeit.default_timer()
+    for _ in xrange(num_sentences):
+        send(SENTENCE)
+    return (timeit.default_timer() - start) / num_sentences
+
+def main(args):
+    server = StandInServer(("127.0.0.1", 0), StandInHandler)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    ip_address, port = server.server_address
+    options = {"instantiate": "true", "format": "prolog"}
+
+    # Every request goes to the server, not to the parse cache
+    with CCBoxerAPI(ip_address=ip_address, port=port, use_cache=False) as ccboxer:
+        url = ccboxer._base_url + '?' + '&'.join([key + '=' + value for (key, value) in options.iteritems()])
+        without_session_time = time_sentences(lambda s: send_without_session(url, s), args.num_sentences)
+        session_time = time_sentences(lambda s: ccboxer._send_request(s, options=options), args.num_sentences)
+        stats = ccboxer.get_connection_stats()
+    server.shutdown()
+
+    print("{:<18} {:>16}".format("", "Per sentence (ms)"))
+    print("{:<18} {:>16.3f}".format("New connection", 1000 * without_session_time))
+    print("{:<18} {:>16.3f}".format("Pooled session", 1000 * session_time))
+    print("Speedup {:.2f}x, session: {} requests over {} connections ({} reused, {} retries)".format(
+        without_session_time / session_time, stats["requests"], stats["connections"],
+        stats["reused"], stats["retries"]))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark the per-sentence latency of CCBoxerAPI requests against a local stand-in server, with and without the pooled session.")
+    parser.add_argument("--num-sentences",
+                        type=int,
+                        default=1000)
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,78 @@
+import timeit
+from collections import OrderedDict
+from .. import irc_crawler
+from .. import definition_extractor
+
+
+def extract_definitions_per_term(level):
+    # extract_definitions as done before the single-pass matcher, one regex
+    # compile and scan per sentence and term
+    defined_terms = definition_extractor.extract_defined_terms(level)
+    unique_terms = set(defined_terms)
+    definitions = OrderedDict()
+    for sentence in level.get_sentences():
+        for term in unique_terms:
+            matches = definition_extractor.get_term_regex(term).findall(sentence)
+            if len(matches) == 0: continue
+            assert len(matches) == 1
+            def_type, rest = matches[0]
+            assert def_type in definition_extractor.DEFINITION_TYPES
+            assert len(rest) > 0
+            while term in definitions:
+                term = u"{}#".format(term)
+            definitions[term] = {
+                "sentence": sentence,
+                "type": def_type,
+                "rest": rest
+            }
+    return defined_terms, definitions
+
+def get_densest_sections(crawler, num_sections):
+    # Sections with the most defined terms, sentences are tokenized here so
+    # that timings only include matching
+    sections = list(crawler.iterate_over_sections())
+    for section in sections:
+        section.get_sentences()
+    sections.sort(key=lambda s: len(definition_extractor.extract_defined_terms(s)), reverse=True)
+    return sections[:num_sections]
+
+def time_extraction(extract, section, repeat):
+    timer = timeit.Timer(lambda: extract(section))
+    return min(timer.repeat(repeat=repeat, number=1))
+
+def main(args):
+    crawler = irc_crawler.IRCCrawler()
+    sections = get_densest_sections(crawler, args.num_sections)
+
+    print("{:<12} {:>8} {:>16} {:>16} {:>10}".format(
+        "Section", "Terms", "Per term (ms)", "One pass (ms)", "Speedup"))
+    total_per_term_time = 0.0
+    total_one_pass_time = 0.0
+    for section in sections:
+        assert extract_definitions_per_term(section) == definition_extractor.extract_definitions(section), \
+            u"Different definitions in {0}".format(section.id)
+        per_term_time = time_extraction(extract_definitions_per_term, section, args.repeat)
+        one_pass_time = time_extraction(definition_extractor.extract_definitions, section, args.repeat)
+        total_per_term_time += per_term_time
+        total_one_pass_time += one_pass_time
+        num_terms = len(set(definition_extractor.extract_defined_terms(section)))
+        print("{:<12} {:>8} {:>16.2f} {:>16.2f} {:>9.1f}x".format(
+            section.id.val, num_terms, 1000 * per_term_time, 1000 * one_pass_time,
+            per_term_time / one_pass_time))
+    print("Total over {} sections: per term {:.2f} ms, one pass {:.2f} ms".format(
+        len(sections), 1000 * total_per_term_time, 1000 * total_one_pass_time))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark definition extraction, one regex per term vs a single pass.")
+    parser.add_argument("--num-sections",
+                        type=int,
+                        default=10,
+                        help="Number of sections with the most defined terms to time.")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="Number of timed extractions per section, the minimum is reported.")
+    args = parser.parse_args()
+    main(args)
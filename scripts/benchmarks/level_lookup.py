@@ -0,0 +1,65 @@
+import timeit
+from .. import irc_crawler
+
+
+def xpath_get_level_node(crawler, level_id):
+    # Lookup as done before the identifier index, one XPath scan per call
+    xpath_expression = "//{0}:*[@identifier='{1}{2}']".format(
+        crawler.default_namespace, crawler.identifier_prefix, level_id)
+    nodes = crawler.root.xpath(xpath_expression, namespaces=crawler.nsmap)
+    assert len(nodes) <= 1
+    if len(nodes) == 0:
+        raise irc_crawler.LevelDoesNotExistException()
+    return nodes[0]
+
+def sweep_level_ids(crawler, num_level_ids):
+    # Level ids spread evenly over the document, from first to last section
+    level_ids = []
+    for section in crawler.iterate_over_sections():
+        for level in section.preorder_transversal():
+            level_ids.append(level.id.val)
+    step = max(1, len(level_ids) // num_level_ids)
+    return level_ids[::step][:num_level_ids]
+
+def time_lookups(lookup, crawler, level_id, repeat):
+    level_id = irc_crawler.LevelId(level_id)
+    timer = timeit.Timer(lambda: lookup(crawler, level_id))
+    return min(timer.repeat(repeat=repeat, number=1))
+
+def main(args):
+    # Both lookups need the parsed tree
+    crawler = irc_crawler.IRCCrawler(use_snapshot=False)
+    level_ids = sweep_level_ids(crawler, args.num_level_ids)
+
+    start = timeit.default_timer()
+    crawler._level_node_index = crawler._build_level_node_index()
+    index_build_time = timeit.default_timer() - start
+    print("Index build time: {:.2f} ms".format(1000 * index_build_time))
+
+    print("{:<30} {:>15} {:>15} {:>10}".format("Level ID", "XPath (us)", "Index (us)", "Speedup"))
+    total_xpath_time = 0.0
+    total_index_time = 0.0
+    for level_id in level_ids:
+        xpath_time = time_lookups(xpath_get_level_node, crawler, level_id, args.repeat)
+        index_time = time_lookups(irc_crawler.IRCCrawler._get_level_node, crawler, level_id, args.repeat)
+        total_xpath_time += xpath_time
+        total_index_time += index_time
+        print("{:<30} {:>15.1f} {:>15.1f} {:>9.0f}x".format(
+            level_id, 1e6 * xpath_time, 1e6 * index_time, xpath_time / index_time))
+    print("Total over {} lookups: XPath {:.2f} ms, index {:.2f} ms (+ {:.2f} ms to build)".format(
+        len(level_ids), 1000 * total_xpath_time, 1000 * total_index_time, 1000 * index_build_time))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark level lookup latency, XPath scan vs identifier index.")
+    parser.add_argument("--num-level-ids",
+                        type=int,
+                        default=20,
+                        help="Number of level ids to sample across the document.")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="Number of timed lookups per level id, the minimum is reported.")
+    args = parser.parse_args()
+    main(args)
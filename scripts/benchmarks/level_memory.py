@@ -0,0 +1,50 @@
+import gc
+import os
+import multiprocessing
+from .. import irc_crawler
+from .. import compact_level
+
+
+def current_rss_mb():
+    # Linux only, second field of statm is the resident set size in pages
+    with open("/proc/self/statm", 'r') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf("SC_PAGE_SIZE") / float(1 << 20)
+
+def load_levels(crawler):
+    return list(crawler.iterate_over_sections())
+
+def load_compact_tree(crawler):
+    # Sections are converted one at a time, Level objects never pile up
+    tree = compact_level.CompactLevelTree()
+    for section in crawler.iterate_over_sections():
+        tree.append_records(irc_crawler.flatten_level(section))
+    return tree
+
+def measure(representation, results):
+    crawler = irc_crawler.IRCCrawler()
+    gc.collect()
+    rss_before = current_rss_mb()
+    if representation == "level":
+        levels = load_levels(crawler)
+        num_levels = sum(1 for s in levels for _ in s.preorder_transversal())
+    else:
+        levels = load_compact_tree(crawler)
+        num_levels = len(levels)
+    gc.collect()
+    results.put((representation, num_levels, current_rss_mb() - rss_before))
+
+def main():
+    # Each representation is loaded in its own process, so neither sees the
+    # other's memory
+    results = multiprocessing.Queue()
+    for representation in ["level", "compact"]:
+        process = multiprocessing.Process(target=measure, args=(representation, results))
+        process.start()
+        process.join()
+        representation, num_levels, rss_mb = results.get()
+        print("{:<10} {:>10} levels {:>10.1f} MB RSS".format(representation, num_levels, rss_mb))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+import multiprocessing
+import timeit
+from .. import parallel_corpus
+from .. import definition_extractor
+from .. import rule_extractor
+
+TASKS = {
+    "definitions": definition_extractor.extract_definitions,
+    "rules": rule_extractor.extract_rules
+}
+
+
+def run(func, jobs):
+    start = timeit.default_timer()
+    results = list(parallel_corpus.map_sections(func, jobs=jobs))
+    return timeit.default_timer() - start, results
+
+def main(args):
+    func = TASKS[args.task]
+    max_jobs = args.max_jobs or multiprocessing.cpu_count()
+    jobs_sweep = [1]
+    while jobs_sweep[-1] * 2 <= max_jobs:
+        jobs_sweep.append(jobs_sweep[-1] * 2)
+    if jobs_sweep[-1] != max_jobs:
+        jobs_sweep.append(max_jobs)
+
+    serial_time, serial_results = run(func, 1)
+    print("{:>5} {:>12} {:>10} {:>10}".format("Jobs", "Time (s)", "Speedup", "Identical"))
+    print("{:>5} {:>12.2f} {:>9.2f}x {:>10}".format(1, serial_time, 1.0, "yes"))
+    for jobs in jobs_sweep[1:]:
+        parallel_time, parallel_results = run(func, jobs)
+        identical = "yes" if parallel_results == serial_results else "NO"
+        print("{:>5} {:>12.2f} {:>9.2f}x {:>10}".format(
+            jobs, parallel_time, serial_time / parallel_time, identical))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark parallel corpus-wide extraction against the serial crawl.")
+    parser.add_argument("--task",
+                        choices=sorted(TASKS.keys()),
+                        default="definitions")
+    parser.add_argument("--max-jobs",
+                        type=int,
+                        default=None,
+                        help="Largest number of processes to try, defaults to the number of cores.")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,69 @@
+import timeit
+from .. import irc_crawler
+from .. import definition_extractor
+from ..term_counter import TermCounter
+
+
+def count_terms_per_term(text, terms):
+    # Term counts as done by make_freq_hist before the automaton, one scan of
+    # the text per term
+    return dict((term, text.count(term)) for term in terms)
+
+def get_densest_sections(crawler, num_sections):
+    # Sections with the most distinct defined terms, with their text and terms
+    sections = []
+    for section in crawler.iterate_over_sections():
+        terms = list(set(definition_extractor.extract_defined_terms(section)))
+        sections.append((section.id.val, u'\n'.join(section.get_sentences()), terms))
+    sections.sort(key=lambda s: len(s[2]), reverse=True)
+    return sections[:num_sections]
+
+def time_counting(count, text, terms, repeat):
+    timer = timeit.Timer(lambda: count(text, terms))
+    return min(timer.repeat(repeat=repeat, number=1))
+
+def main(args):
+    crawler = irc_crawler.IRCCrawler()
+    sections = get_densest_sections(crawler, args.num_sections)
+
+    print("{:<12} {:>8} {:>10} {:>16} {:>12} {:>12}".format(
+        "Section", "Terms", "Chars", "Per term (ms)", "Build (ms)", "Scan (ms)"))
+    total_per_term_time = 0.0
+    total_build_time = 0.0
+    total_scan_time = 0.0
+    for section_id, text, terms in sections:
+        counter = TermCounter(terms)
+        # text.count skips the occurrences of a term that overlap a previous
+        # one, e.g. the second "aa" in "aaa", TermCounter counts them
+        per_term_counts = count_terms_per_term(text, terms)
+        counts = counter.count(text)
+        for term in terms:
+            assert counts[term] >= per_term_counts[term], \
+                u"Missed occurrences of {0} in {1}".format(term, section_id)
+        per_term_time = time_counting(count_terms_per_term, text, terms, args.repeat)
+        build_time = time_counting(lambda text, terms: TermCounter(terms), text, terms, args.repeat)
+        scan_time = time_counting(lambda text, terms: counter.count(text), text, terms, args.repeat)
+        total_per_term_time += per_term_time
+        total_build_time += build_time
+        total_scan_time += scan_time
+        print("{:<12} {:>8} {:>10} {:>16.2f} {:>12.2f} {:>12.2f}".format(
+            section_id, len(terms), len(text), 1000 * per_term_time,
+            1000 * build_time, 1000 * scan_time))
+    print("Total over {} sections: per term {:.2f} ms, build {:.2f} ms, scan {:.2f} ms".format(
+        len(sections), 1000 * total_per_term_time, 1000 * total_build_time,
+        1000 * total_scan_time))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Benchmark counting defined terms, one text.count per term vs one pass of TermCounter.")
+    parser.add_argument("--num-sections",
+                        type=int,
+                        default=10,
+                        help="Number of sections with the most defined terms to time.")
+    parser.add_argument("--repeat",
+                        type=int,
+                        default=5,
+                        help="Number of timed counts per section, the minimum is reported.")
+    args = parser.parse_args()
+    main(args)
@@ -1,40 +1,152 @@
+import time
+import threading
+from multiprocessing.pool import ThreadPool
 import requests
+from requests.adapters import HTTPAdapter
 import nltk
 from nltk.sem.boxer import BoxerOutputDrsParser, NltkDrtBoxerDrsInterpreter
+import parse_cache
+
+# Statuses of a busy or restarting server, retried like connection errors
+RETRY_STATUSES = [502, 503, 504]
+# Requests in flight at once by interpret_many, at most the pool size so that
+# every request has a kept-alive connection
+DEFAULT_CONCURRENCY = 8
+# Name of the parser in the parse cache
+PARSER = "candc-boxer"
 
 
 class CCBoxerAPIException(Exception):
     pass
 
 class CCBoxerAPI(object):
-    def __init__(self, ip_address="128.52.170.142", port=8888):
+    # Requests go through one session, so the connections to the server are
+    # kept alive and reused between sentences. pool_size is the number of
+    # connections kept open, timeouts are in seconds. A request failing to
+    # connect, timing out or getting one of RETRY_STATUSES is sent again up to
+    # max_retries times, after backoff_factor * 2^(retry - 1) seconds.
+    # With use_cache, Boxer outputs are read from and kept in the parse cache.
+    def __init__(self, ip_address="128.52.170.142", port=8888, pool_size=10,
+                 connect_timeout=10.0, read_timeout=120.0, max_retries=3,
+                 backoff_factor=0.5, use_cache=True):
         self._base_url = "http://{0}:{1}/json/pipeline".format(ip_address, port)
+        self._timeout = (connect_timeout, read_timeout)
+        self._max_retries = max_retries
+        self._backoff_factor = backoff_factor
+        self._adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self._session = requests.Session()
+        self._session.mount("http://", self._adapter)
+        self._session.headers.update({'Content-type': 'text/plain; charset=UTF-8'})
+        self._num_requests = 0
+        self._num_retries = 0
+        # Requests are counted from the threads of interpret_many
+        self._stats_lock = threading.Lock()
+        self.cache = parse_cache.get_default_cache() if use_cache else None
         ### Taken from https://github.com/nltk/nltk/blob/develop/nltk/sem/boxer.py
         self._boxer_drs_interpreter = NltkDrtBoxerDrsInterpreter()
 
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def get_connection_stats(self):
+        # Requests sent (retries included), retries and connections opened,
+        # the other requests reused an open connection
+        pool = self._adapter.poolmanager.connection_from_url(self._base_url)
+        return {
+            "requests": self._num_requests,
+            "retries": self._num_retries,
+            "connections": pool.num_connections,
+            "reused": self._num_requests - pool.num_connections
+        }
+
     def interpret(self, sentences, debug=False):
         payload = u'\n'.join(sentences)
         options = {"instantiate": "true", "format": "prolog"}
-        boxer_out = self._send_request(payload, options=options)
-        if debug: print "Server Error Message: |{}|".format(boxer_out["err"].replace('\n', '-newline-'))
+        # Prolog output of Boxer, from the parse cache if the payload was
+        # parsed before by the same server. Errors of the request itself are
+        # not kept, only outputs Boxer failed on.
+        cache_options = dict(options, server=self._base_url)
+        entry = None
+        if self.cache is not None:
+            entry = self.cache.get(PARSER, cache_options, payload)
+        if entry is not None:
+            ok, boxer_prolog = entry
+            if not ok:
+                raise CCBoxerAPIException(boxer_prolog)
+        else:
+            boxer_out = self._send_request(payload, options=options)
+            if debug: print "Server Error Message: |{}|".format(boxer_out["err"].replace('\n', '-newline-'))
+            boxer_prolog = boxer_out["out"]
         try:
-            drs_dict = self._parse_to_drs_dict(boxer_out["out"], False)
+            drs_dict = self._parse_to_drs_dict(boxer_prolog, False)
         except nltk.sem.logic.LogicalExpressionException:
+            self._cache_crash(cache_options, payload, entry, "Unable to parse response.")
             raise CCBoxerAPIException("Unable to parse response.")
         if len(drs_dict) == 0:
+            self._cache_crash(cache_options, payload, entry, "Recieved empty response.")
             raise CCBoxerAPIException("Recieved empty response.")
+        if self.cache is not None and entry is None:
+            self.cache.put(PARSER, cache_options, payload, boxer_prolog)
         # drs_dict has form {'1': DRS1, '2': DRS2, ... }
         drss = [(int(k), v) for (k, v) in drs_dict.items()]
         drss.sort(key=lambda pair: pair[0])
         drss = [pair[1] for pair in drss]
         return drss
 
+    def interpret_many(self, sentences, concurrency=DEFAULT_CONCURRENCY):
+        # Interprets each sentence alone, with up to concurrency requests in
+        # flight. Returns, in the order of sentences, the DRSs of each
+        # sentence or the CCBoxerAPIException it raised, so that one crash or
+        # failed request does not stop the others.
+        if len(sentences) == 0:
+            return []
+        pool = ThreadPool(min(concurrency, len(sentences)))
+        try:
+            return pool.map(self._interpret_or_exception, sentences, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+
+    def _interpret_or_exception(self, sentence):
+        try:
+            return self.interpret([sentence])
+        except CCBoxerAPIException as e:
+            return e
+        except requests.RequestException as e:
+            # Connection errors and timeouts left after the retries
+            return CCBoxerAPIException(str(e))
+
+    def _cache_crash(self, cache_options, payload, entry, message):
+        # Keeps a negative entry for a payload Boxer answered but failed on
+        if self.cache is not None and entry is None:
+            self.cache.put(PARSER, cache_options, payload, message, ok=False)
+
     def _send_request(self, payload, options=dict()):
         params = ""
         if len(options) > 0:
             params = '?' + '&'.join([key + '=' + value for (key, value) in options.iteritems()])
         url = self._base_url + params
-        response = requests.post(url, data=payload.encode("UTF-8"), headers={'Content-type': 'text/plain; charset=UTF-8'})
+        retry = 0
+        while True:
+            with self._stats_lock:
+                self._num_requests += 1
+            try:
+                response = self._session.post(url, data=payload.encode("UTF-8"), timeout=self._timeout)
+                if response.status_code not in RETRY_STATUSES or retry == self._max_retries:
+                    break
+            except (requests.ConnectionError, requests.Timeout):
+                if retry == self._max_retries:
+                    raise
+            retry += 1
+            with self._stats_lock:
+                self._num_retries += 1
+            time.sleep(self._backoff_factor * 2 ** (retry - 1))
         try:
             response.raise_for_status()
         except requests.HTTPError, error:
@@ -0,0 +1,187 @@
+# This Python file uses the following encoding: UTF-8
+from array import array
+from collections import OrderedDict
+from tokenization import sent_tokenize, word_tokenize
+from irc_crawler import LevelId, TAGS, flatten_level
+
+# Text fields stored per level, as (offset, length) into the shared buffer.
+# "key" and "parent_continuation" are the level's entry in its parent's sublevels.
+TEXT_FIELDS = [
+    "id", "num", "heading", "chapeau", "content", "continuation", "key",
+    "parent_continuation"
+]
+NUM_TEXT_FIELDS = len(TEXT_FIELDS)
+ID, NUM, HEADING, CHAPEAU, CONTENT, CONTINUATION, KEY, PARENT_CONTINUATION = range(
+    NUM_TEXT_FIELDS)
+# Length of a missing (None) text field
+NONE_LENGTH = -1
+
+
+class CompactLevelTree(object):
+    # Struct-of-arrays representation of many levels. Level i has parent
+    # parent[i], first child first_child[i] and next sibling next_sibling[i]
+    # (-1 when missing), tag TAGS[tag_codes[i]], and its texts are UTF-8 slices
+    # of one shared buffer.
+    def __init__(self):
+        self.parent = array('i')
+        self.first_child = array('i')
+        self.next_sibling = array('i')
+        self.tag_codes = array('b')
+        self.text_offsets = array('i')
+        self.text_lengths = array('i')
+        self.text = bytearray()
+        self.roots = array('i')
+
+    @staticmethod
+    def from_levels(levels):
+        tree = CompactLevelTree()
+        for level in levels:
+            tree.append_records(flatten_level(level))
+        return tree
+
+    def __len__(self):
+        return len(self.parent)
+
+    def _append_text(self, s):
+        if s is None:
+            self.text_offsets.append(len(self.text))
+            self.text_lengths.append(NONE_LENGTH)
+            return
+        encoded = s.encode("UTF-8") if isinstance(s, unicode) else s
+        self.text_offsets.append(len(self.text))
+        self.text_lengths.append(len(encoded))
+        self.text.extend(encoded)
+
+    def append_records(self, records):
+        # records are the preorder tuples of irc_crawler.flatten_level
+        base = len(self.parent)
+        last_child = dict()
+        for position, record in enumerate(records):
+            parent, key, parent_continuation, id, tag, num, heading, chapeau, \
+                content, continuation = record
+            index = base + position
+            if parent < 0:
+                self.parent.append(-1)
+                self.roots.append(index)
+            else:
+                parent_index = base + parent
+                self.parent.append(parent_index)
+                if parent_index in last_child:
+                    self.next_sibling[last_child[parent_index]] = index
+                else:
+                    self.first_child[parent_index] = index
+                last_child[parent_index] = index
+            self.first_child.append(-1)
+            self.next_sibling.append(-1)
+            self.tag_codes.append(TAGS.index(tag))
+            for s in [id, num, heading, chapeau, content, continuation, key,
+                      parent_continuation]:
+                self._append_text(s)
+
+    def get_text(self, index, field):
+        position = index * NUM_TEXT_FIELDS + field
+        length = self.text_lengths[position]
+        if length == NONE_LENGTH:
+            return None
+        offset = self.text_offsets[position]
+        return self.text[offset:offset + length].decode("UTF-8")
+
+    def iterate_children(self, index):
+        child = self.first_child[index]
+        while child != -1:
+            yield child
+            child = self.next_sibling[child]
+
+    def level(self, index):
+        return CompactLevel(self, index)
+
+    def iterate_over_sections(self):
+        for index in self.roots:
+            yield CompactLevel(self, index)
+
+
+class CompactLevel(object):
+    # Stateless view over one level of a CompactLevelTree, with the Level API
+    __slots__ = ("_tree", "_index")
+
+    def __init__(self, tree, index):
+        self._tree = tree
+        self._index = index
+
+    @property
+    def id(self):
+        return LevelId(self._tree.get_text(self._index, ID))
+
+    @property
+    def tag(self):
+        return TAGS[self._tree.tag_codes[self._index]]
+
+    @property
+    def num(self):
+        return self._tree.get_text(self._index, NUM)
+
+    @property
+    def heading(self):
+        return self._tree.get_text(self._index, HEADING)
+
+    @property
+    def chapeau(self):
+        return self._tree.get_text(self._index, CHAPEAU)
+
+    @property
+    def content(self):
+        return self._tree.get_text(self._index, CONTENT)
+
+    @property
+    def continuation(self):
+        return self._tree.get_text(self._index, CONTINUATION)
+
+    @property
+    def sublevels(self):
+        sublevels = OrderedDict()
+        for child in self._tree.iterate_children(self._index):
+            key = self._tree.get_text(child, KEY)
+            continuation = self._tree.get_text(child, PARENT_CONTINUATION)
+            sublevels[key] = [CompactLevel(self._tree, child), continuation]
+        return sublevels
+
+    def get_average_tokens_per_sentence(self, word_tokenizer=word_tokenize):
+        sentences = self.get_sentences()
+        if len(sentences) == 0:
+            return 0
+        num_tokens = 0
+        for sent in sentences:
+            num_tokens += len(word_tokenizer(sent))
+        return num_tokens / float(len(sentences))
+
+    def get_sentences(self, sentence_tokenizer=sent_tokenize):
+        return sentence_tokenizer(u" ".join(self.get_sentence_fragments()))
+
+    def get_sentence_fragments(self):
+        tree = self._tree
+        sent_fragments = []
+        for field in [CHAPEAU, CONTENT]:
+            s = tree.get_text(self._index, field)
+            if s is not None:
+                sent_fragments.append(s)
+        for child in tree.iterate_children(self._index):
+            sent_fragments.extend(CompactLevel(tree, child).get_sentence_fragments())
+            continuation = tree.get_text(child, PARENT_CONTINUATION)
+            if continuation is not None:
+                sent_fragments.append(continuation)
+        continuation = tree.get_text(self._index, CONTINUATION)
+        if continuation is not None:
+            sent_fragments.append(continuation)
+        return sent_fragments
+
+    def preorder_transversal(self):
+        yield self
+        for child in self._tree.iterate_children(self._index):
+            for l in CompactLevel(self._tree, child).preorder_transversal():
+                yield l
+
+    def __unicode__(self):
+        return u'\n'.join(self.get_sentences())
+
+    def __str__(self):
+        return unicode(self).encode("UTF-8")
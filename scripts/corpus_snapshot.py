@@ -0,0 +1,132 @@
+import os
+import sys
+import hashlib
+import marshal
+import mmap
+import struct
+
+SNAPSHOT_FORMAT_VERSION = 2
+SNAPSHOT_MAGIC = b"IRCSNAP\x01"
+# The last bytes of a snapshot hold the offset of its section table
+FOOTER_FORMAT = "<Q"
+FOOTER_SIZE = struct.calcsize(FOOTER_FORMAT)
+
+
+def get_snapshot_filepath(xml_filepath):
+    return "{0}.snapshot".format(xml_filepath)
+
+def hash_file(filepath, chunk_size=1 << 20):
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def get_source_info(xml_filepath):
+    xml_stat = os.stat(xml_filepath)
+    return {
+        "xml_hash": hash_file(xml_filepath),
+        "xml_size": xml_stat.st_size,
+        "xml_mtime": xml_stat.st_mtime
+    }
+
+def is_source_unchanged(source_info, xml_filepath):
+    xml_stat = os.stat(xml_filepath)
+    if source_info["xml_size"] == xml_stat.st_size and source_info["xml_mtime"] == xml_stat.st_mtime:
+        return True
+    # File was touched or copied, only its content matters
+    return source_info["xml_hash"] == hash_file(xml_filepath)
+
+def _snapshot_format():
+    # marshal output is only readable by the same marshal version and major Python
+    return (SNAPSHOT_FORMAT_VERSION, marshal.version, sys.version_info[0])
+
+def write_snapshot(xml_filepath, sections):
+    # sections is an iterable of (section_id, status, records), in document order.
+    # Each section is marshalled on its own so it can be loaded independently.
+    filepath = get_snapshot_filepath(xml_filepath)
+    tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+    table = get_source_info(xml_filepath)
+    table["format"] = _snapshot_format()
+    table["sections"] = []
+    try:
+        with open(tmp_filepath, 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            offset = len(SNAPSHOT_MAGIC)
+            for section_id, status, records in sections:
+                blob = marshal.dumps(records)
+                f.write(blob)
+                table["sections"].append((section_id, status, offset, len(blob)))
+                offset += len(blob)
+            f.write(marshal.dumps(table))
+            f.write(struct.pack(FOOTER_FORMAT, offset))
+    except:
+        os.remove(tmp_filepath)
+        raise
+    # Readers never see a half-written snapshot
+    os.rename(tmp_filepath, filepath)
+    return filepath
+
+
+class CorpusSnapshot:
+    def __init__(self, snapshot_file, snapshot_mmap, table):
+        self._file = snapshot_file
+        self._mmap = snapshot_mmap
+        self.xml_hash = table["xml_hash"]
+        self.sections = table["sections"]
+        self._section_positions = dict()
+        for position, section in enumerate(self.sections):
+            self._section_positions.setdefault(section[0], []).append(position)
+
+    @staticmethod
+    def _is_fresh(table, xml_filepath):
+        if table.get("format") != _snapshot_format():
+            return False
+        return is_source_unchanged(table, xml_filepath)
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no snapshot or if it is stale
+        filepath = get_snapshot_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        snapshot_file = open(filepath, 'rb')
+        try:
+            snapshot_mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file
+            snapshot_file.close()
+            return None
+        try:
+            assert snapshot_mmap[:len(SNAPSHOT_MAGIC)] == SNAPSHOT_MAGIC
+            table_end = len(snapshot_mmap) - FOOTER_SIZE
+            table_offset, = struct.unpack(FOOTER_FORMAT, snapshot_mmap[table_end:])
+            table = marshal.loads(snapshot_mmap[table_offset:table_end])
+            fresh = CorpusSnapshot._is_fresh(table, xml_filepath)
+        except (AssertionError, ValueError, EOFError, TypeError, KeyError, struct.error):
+            fresh = False
+        if not fresh:
+            snapshot_mmap.close()
+            snapshot_file.close()
+            return None
+        return CorpusSnapshot(snapshot_file, snapshot_mmap, table)
+
+    def _load_records(self, position):
+        _, _, offset, length = self.sections[position]
+        return marshal.loads(self._mmap[offset:offset + length])
+
+    def get_section(self, position):
+        section_id, status = self.sections[position][:2]
+        return section_id, status, self._load_records(position)
+
+    def get_section_records(self, section_id):
+        # Usually one, more if a section id is repeated in the document
+        return [self._load_records(p) for p in self._section_positions.get(section_id, [])]
+
+    def iterate_over_sections(self):
+        for position in xrange(len(self.sections)):
+            yield self.get_section(position)
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
@@ -0,0 +1,84 @@
+import os
+import threading
+from os.path import realpath
+import corpus_snapshot
+import irc_crawler
+
+
+class CorpusStore(object):
+    # Crawlers of any number of titles, shared by everything in the process so
+    # that each title is only parsed and indexed once. A file reached through
+    # several paths, or copied, is only loaded once too: crawlers are looked up
+    # by real path, then by content hash, for each crawler class. Files are
+    # only hashed when another loaded file has the same size. Thread-safe, a
+    # title requested by several threads at once is loaded by one of them.
+    def __init__(self, crawler_class=irc_crawler.IRCCrawler):
+        self.crawler_class = crawler_class
+        self._crawlers_by_path = dict()
+        # (crawler class, file size) => [real path, content hash or None,
+        # crawler] of the files loaded
+        self._loaded_by_size = dict()
+        self._crawlers_by_title = dict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _find_copy(self, xml_filepath, loaded):
+        # Crawler of a loaded file with the same content as xml_filepath
+        xml_hash = corpus_snapshot.hash_file(xml_filepath)
+        for entry in loaded:
+            if entry[1] is None:
+                entry[1] = corpus_snapshot.hash_file(entry[0])
+            if entry[1] == xml_hash:
+                return entry[2], xml_hash
+        return None, xml_hash
+
+    def get_crawler(self, xml_filepath=irc_crawler.IRC_XML_FILEPATH,
+                    crawler_class=None):
+        if crawler_class is None:
+            crawler_class = self.crawler_class
+        path_key = (crawler_class, realpath(xml_filepath))
+        with self._lock:
+            crawler = self._crawlers_by_path.get(path_key)
+            if crawler is not None:
+                self.hits += 1
+                return crawler
+            size_key = (crawler_class, os.path.getsize(path_key[1]))
+            loaded = self._loaded_by_size.setdefault(size_key, [])
+            crawler, xml_hash = None, None
+            if len(loaded) > 0:
+                crawler, xml_hash = self._find_copy(path_key[1], loaded)
+            if crawler is not None:
+                self.hits += 1
+            else:
+                self.misses += 1
+                crawler = crawler_class(xml_filepath=path_key[1])
+                loaded.append([path_key[1], xml_hash, crawler])
+                # First file loaded for a title is the one found by get_title
+                self._crawlers_by_title.setdefault(crawler.title, crawler)
+            self._crawlers_by_path[path_key] = crawler
+            return crawler
+
+    def get_title(self, title):
+        # Crawler of a title that was loaded before, e.g. u"26"
+        with self._lock:
+            return self._crawlers_by_title[unicode(title)]
+
+    def titles(self):
+        with self._lock:
+            return sorted(self._crawlers_by_title)
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store():
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = CorpusStore()
+        return _default_store
+
+def get_crawler(xml_filepath=irc_crawler.IRC_XML_FILEPATH, crawler_class=None):
+    return get_default_store().get_crawler(xml_filepath, crawler_class)
@@ -1,6 +1,7 @@
 # This Python file uses the following encoding: UTF-8
 import re
 from irc_crawler import IRCCrawler
+from term_counter import TermCounter
 from collections import OrderedDict
 
 
@@ -13,6 +14,13 @@ DEFINITION_TYPES = [
     u"shall not include"
 ]
 TERM_REGEX = re.compile(ur"the term (?:(“[^”]+”)|(‘[^’]+’)) (?:{0})".format(u"|".join(DEFINITION_TYPES)), re.UNICODE | re.IGNORECASE)
+# Every definition of any term, including overlapping ones. The lookahead is
+# empty so that each position is tried, the groups are the quoted term and the
+# definition type.
+DEFINITION_REGEX = re.compile(ur"(?=the term (?:“([^”]+)”|‘([^’]+)’) ({0}))".format(u"|".join(DEFINITION_TYPES)), re.UNICODE | re.IGNORECASE)
+# Terms with these characters are regex patterns in get_term_regex, or can't be
+# told apart from their quotes by DEFINITION_REGEX
+SPECIAL_TERM_CHARACTERS = set(u".^$*+?{}[]\\|()“”‘’\n")
 
 
 def get_term_regex(term):
@@ -20,7 +28,9 @@ def get_term_regex(term):
     return re.compile(ur"the term (?:“{0}”|‘{0}’) {1}(.*)".format(term, definition_types_pattern), re.UNICODE | re.IGNORECASE)
 
 def extract_defined_terms(level):
-    text = u'\n'.join(level.get_sentences())
+    return find_defined_terms(u'\n'.join(level.get_sentences()))
+
+def find_defined_terms(text):
     defined_terms = []
     matches = TERM_REGEX.findall(text)
     for group1, group2 in matches:
@@ -37,68 +47,147 @@ def extract_defined_terms(level):
         defined_terms.append(term)
     return defined_terms
 
-def extract_definitions(level):
-    defined_terms = extract_defined_terms(level)
+def find_term_definitions(sentence, terms_by_lowercase, special_terms):
+    # Term => (type, rest, start) of its definitions in the sentence, exactly
+    # what get_term_regex(term).finditer(sentence) would find for each term,
+    # but with one scan of the sentence. terms_by_lowercase maps each
+    # lowercase term to the terms that are equal to it ignoring case.
+    matches = dict()
+    # Where the (.*) of the last definition of each term stops, findall skips
+    # anything before that
+    line_ends = dict()
+    for match in DEFINITION_REGEX.finditer(sentence):
+        quoted_term = match.group(1) if match.group(1) is not None else match.group(2)
+        terms = terms_by_lowercase.get(quoted_term.lower())
+        if terms is None:
+            continue
+        start = match.start()
+        line_end = sentence.find(u"\n", match.end(3))
+        if line_end == -1:
+            line_end = len(sentence)
+        for term in terms:
+            if line_ends.get(term, -1) > start:
+                continue
+            line_ends[term] = line_end
+            matches.setdefault(term, []).append(
+                (match.group(3), sentence[match.end(3):line_end], start))
+    for term in special_terms:
+        term_matches = [(m.group(1), m.group(2), m.start())
+                        for m in get_term_regex(term).finditer(sentence)]
+        if len(term_matches) > 0:
+            matches[term] = term_matches
+    return matches
+
+def iterate_over_definitions(defined_terms, sentences):
+    # (sentence number, term, type, rest, start in the sentence) of the
+    # definitions of the terms, in the order of extract_definitions
     unique_terms = set(defined_terms)
-    definitions = OrderedDict()
-    sentences = level.get_sentences()
-    for sentence in sentences:
-        for term in unique_terms:
-            term_def_regex = get_term_regex(term)
-            matches = term_def_regex.findall(sentence)
-            if len(matches) == 0: continue
+    # Matches are added in the iteration order of the set, as they were when
+    # each term was searched on its own
+    term_positions = dict((term, i) for i, term in enumerate(unique_terms))
+    terms_by_lowercase = dict()
+    special_terms = []
+    for term in unique_terms:
+        if len(SPECIAL_TERM_CHARACTERS.intersection(term)) > 0:
+            special_terms.append(term)
+        else:
+            terms_by_lowercase.setdefault(term.lower(), []).append(term)
+    for sentence_number, sentence in enumerate(sentences):
+        sentence_matches = find_term_definitions(sentence, terms_by_lowercase, special_terms)
+        for term in sorted(sentence_matches, key=term_positions.get):
+            matches = sentence_matches[term]
             assert len(matches) == 1
-            def_type, rest = matches[0]
+            def_type, rest, start = matches[0]
             assert def_type in DEFINITION_TYPES
             assert len(rest) > 0
-            # Terms are sometimes defined multiple times in same section...
-            # TODO: Figure out how to efficiently find definitions at levels below section
-            while term in definitions:
-                term = u"{}#".format(term)
-            definitions[term] = {
-                "sentence": sentence,
-                "type": def_type,
-                "rest": rest
-            }
+            yield sentence_number, term, def_type, rest, start
+
+def extract_definitions(level):
+    defined_terms = extract_defined_terms(level)
+    definitions = OrderedDict()
+    sentences = level.get_sentences()
+    for sentence_number, term, def_type, rest, _ in iterate_over_definitions(defined_terms, sentences):
+        # Terms are sometimes defined multiple times in same section...
+        # TODO: Figure out how to efficiently find definitions at levels below section
+        while term in definitions:
+            term = u"{}#".format(term)
+        definitions[term] = {
+            "sentence": sentences[sentence_number],
+            "type": def_type,
+            "rest": rest
+        }
     return defined_terms, definitions
 
 def fol_definitions(level):
+    return get_fol_definitions(*extract_definitions(level))
+
+def get_definition_links(defined_terms, definitions):
+    # Definition => positions in defined_terms of the other terms mentioned in
+    # its rest, in order. The rests are scanned once for all terms.
+    term_positions = dict()
+    for i, term in enumerate(defined_terms):
+        term_positions.setdefault(term, []).append(i)
+    counter = TermCounter(term_positions.keys())
+    links = OrderedDict()
+    for term, definition in definitions.items():
+        mentioned_terms = set(t for _, t in counter.iterate_over_matches(definition["rest"]))
+        mentioned_terms.discard(term)
+        links[term] = sorted(i for t in mentioned_terms for i in term_positions[t])
+    return links
+
+def get_definition_graph(defined_terms, definitions):
+    # Adjacency lists of the definitions: definition => the other defined
+    # terms mentioned in its rest, in order of first definition. Definitions
+    # are the keys of definitions, so terms defined again end with "#".
+    graph = OrderedDict()
+    for term, positions in get_definition_links(defined_terms, definitions).items():
+        graph[term] = list(OrderedDict.fromkeys(defined_terms[i] for i in positions))
+    return graph
+
+def get_fol_definitions(defined_terms, definitions):
+    # defined_terms and definitions as returned by extract_definitions, or by
+    # definition_scope.DefinitionScopeIndex.extract_definitions
     definition_fol_template = u"all x.({0}{1}(x) -> {2}{3}(x))"
     definitions_as_fol = []
-    defined_terms, definitions = extract_definitions(level)
+    links = get_definition_links(defined_terms, definitions)
     for term, definition in definitions.items():
         def_type = definition["type"]
         rest = definition["rest"]
-        for other_term in defined_terms:
-            if other_term == term: continue
-            if other_term in rest:
-                other_term_sign = ""
-                if "not" in def_type:
-                    other_term_sign = "-"
-                other_term_predicate = term_to_predicate(other_term)
-                defined_term_sign = ""
-                if "other than" in rest or "except" in rest:
-                    defined_term_sign = "-"
-                defined_term_predicate = term_to_predicate(term)
-                definition_fol = definition_fol_template.format(
-                    other_term_sign,
-                    other_term_predicate,
-                    defined_term_sign,
-                    defined_term_predicate
-                )
-                definitions_as_fol.append({
-                    "term": term,
-                    "definition": definition,
-                    "fol": definition_fol
-                })
+        other_term_sign = ""
+        if "not" in def_type:
+            other_term_sign = "-"
+        defined_term_sign = ""
+        if "other than" in rest or "except" in rest:
+            defined_term_sign = "-"
+        defined_term_predicate = term_to_predicate(term)
+        # Once per occurrence of the other term in defined_terms
+        for i in links[term]:
+            definition_fol = definition_fol_template.format(
+                other_term_sign,
+                term_to_predicate(defined_terms[i]),
+                defined_term_sign,
+                defined_term_predicate
+            )
+            definitions_as_fol.append({
+                "term": term,
+                "definition": definition,
+                "fol": definition_fol
+            })
     return definitions_as_fol
 
+# Predicates of the terms seen so far, terms are converted again and again
+_predicates = dict()
+
 def term_to_predicate(term):
+    predicate = _predicates.get(term)
+    if predicate is not None:
+        return predicate
     predicate = term.strip().replace(" ", "_SPACE_").replace("-", "_DASH_").replace(",", "_COMMA_")
     if predicate in ["and", "or", "implies", "iff", "some", "exists", "exist", "all", "forall", "not"]:
         predicate = predicate.upper()
     if len(predicate) == 1:
         predicate = "_{0}_".format(predicate)
+    _predicates[term] = predicate
     return predicate
 
 def main(args):
@@ -0,0 +1,364 @@
+# This Python file uses the following encoding: UTF-8
+import os
+import re
+import marshal
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from lxml import etree
+import corpus_snapshot
+from irc_crawler import TAGS
+from pattern_counts import LEAD_INS
+from definition_extractor import extract_definitions, find_defined_terms, iterate_over_definitions
+
+DEFINITION_SCOPE_INDEX_FORMAT_VERSION = 3
+# Lead-in at the start of a text or of one of its sentences, e.g. "In this
+# subsection, the term ..." or a chapeau "For purposes of this section—". The
+# group is the kind of level it scopes the definitions to.
+LEAD_IN_REGEX = re.compile(ur"(?:^|(?<=\.\s)|(?<=—))(?:{0}) (\w+)".format(
+    u"|".join(re.escape(lead_in) for lead_in in LEAD_INS)), re.UNICODE)
+# Levels above sections are not crawled, they are read from the XML for the
+# definitions scoped to them. Definitions scoped to the title apply to every
+# level of the title.
+ABOVE_SECTION_TAGS = ["subtitle", "division", "subdivision", "chapter", "subchapter",
+                      "part", "subpart"]
+
+
+def get_definition_scope_index_filepath(xml_filepath):
+    return "{0}.scopeindex".format(xml_filepath)
+
+def get_section_ancestors(crawler):
+    # Section id => (identifier, tag) of the levels above it with a tag of
+    # ABOVE_SECTION_TAGS, outermost first, read with one pass over the XML
+    ns_prefix = "{{{0}}}".format(crawler.nsmap[crawler.default_namespace])
+    section_tag = "{0}section".format(ns_prefix)
+    tags = [section_tag] + ["{0}{1}".format(ns_prefix, t) for t in ABOVE_SECTION_TAGS]
+    section_ancestors = dict()
+    # (identifier, tag) of the open levels above sections, identifier is None
+    # for the ones without one
+    ancestors = []
+    section_depth = 0
+    for event, node in etree.iterparse(
+            crawler.xml_filepath, events=("start", "end"), tag=tags):
+        if node.tag == section_tag:
+            if event == "start":
+                identifier = node.get("identifier")
+                if section_depth == 0 and identifier is not None and \
+                        identifier.startswith(crawler.identifier_prefix):
+                    section_id = identifier[len(crawler.identifier_prefix):]
+                    section_ancestors.setdefault(section_id, [
+                        a for a in ancestors if a[0] is not None])
+                section_depth += 1
+            else:
+                section_depth -= 1
+                if section_depth == 0:
+                    # Free the section and everything parsed before it
+                    node.clear()
+                    while node.getprevious() is not None:
+                        del node.getparent()[0]
+        elif section_depth > 0:
+            # Quoted in the notes of a section
+            continue
+        elif event == "start":
+            ancestors.append((node.get("identifier"), node.tag.replace(ns_prefix, '', 1)))
+        else:
+            ancestors.pop()
+    return section_ancestors
+
+def find_lead_ins(text, ancestors):
+    # (position, scope) of the lead-ins of a text of the last level of
+    # ancestors, scope is the level number of the closest ancestor with the
+    # named tag, or -1 for the whole title. Lead-ins naming a level that is
+    # not an ancestor are left out.
+    lead_ins = []
+    for match in LEAD_IN_REGEX.finditer(text):
+        scope_tag = match.group(1).lower()
+        if scope_tag == "title":
+            lead_ins.append((match.start(), -1))
+        elif scope_tag in TAGS or scope_tag in ABOVE_SECTION_TAGS:
+            for level_number, tag in reversed(ancestors):
+                if tag == scope_tag:
+                    lead_ins.append((match.start(), level_number))
+                    break
+    return lead_ins
+
+def get_section_definitions(section, fragments):
+    # ((term, type, rest, sentence, level number), scope) of the definitions
+    # of the section, the same and in the same order as extract_definitions.
+    # Each one is made in the level whose sentence fragment holds its start,
+    # and is scoped by the lead-ins before it in that fragment.
+    fragment_starts = []
+    offset = 0
+    for _, _, _, text in fragments:
+        fragment_starts.append(offset)
+        offset += len(text) + 1
+    section_text = u" ".join(text for _, _, _, text in fragments)
+    sentences = section.get_sentences()
+    # Sentences are pieces of the joined fragments, in order
+    sentence_starts = []
+    offset = 0
+    for sentence in sentences:
+        start = section_text.find(sentence, offset)
+        if start == -1:
+            start = offset
+        sentence_starts.append(start)
+        offset = start + len(sentence)
+    defined_terms = find_defined_terms(u"\n".join(sentences))
+    lead_ins = dict()
+    section_definitions = []
+    for sentence_number, term, def_type, rest, start in iterate_over_definitions(defined_terms, sentences):
+        offset = sentence_starts[sentence_number] + start
+        fragment_number = max(bisect_right(fragment_starts, offset) - 1, 0)
+        level_number, ancestors, scope, text = fragments[fragment_number]
+        if fragment_number not in lead_ins:
+            lead_ins[fragment_number] = find_lead_ins(text, ancestors)
+        for position, lead_in_scope in lead_ins[fragment_number]:
+            if position < offset - fragment_starts[fragment_number]:
+                scope = lead_in_scope
+        section_definitions.append(
+            ((term, def_type, rest, sentences[sentence_number], level_number), scope))
+    return section_definitions
+
+
+class DefinitionScopeIndex(object):
+    # Definitions of the title, each resolved once to the subtree of levels it
+    # applies to. Levels are numbered in preorder, so a subtree is the interval
+    # [scope, subtree_ends[scope]). A definition applies to the levels of the
+    # closest lead-in before it in its own text, or else in the chapeau of one
+    # of its ancestors, and to the levels of its section if there is none.
+    # Levels above sections (chapters, parts, ...) are numbered too, before
+    # their sections, so their subtrees are the ranges of their sections.
+    # Intervals of subtrees are either nested or disjoint, so the intervals
+    # containing a level are the chain of enclosing intervals of the last one
+    # starting at or before it, found by bisection.
+    def __init__(self, level_ids, subtree_ends, definitions, scopes):
+        # Ids of the levels in preorder, the levels above sections have their
+        # XML identifier, e.g. u"/us/usc/t41/stI/ch1"
+        self.level_ids = level_ids
+        self.subtree_ends = subtree_ends
+        # (term, type, rest, sentence, level number), section by section in
+        # the order of extract_definitions
+        self.definitions = definitions
+        # Scope (level number or -1) of each definition
+        self.scopes = scopes
+        self._level_numbers = dict()
+        for level_number, level_id in enumerate(level_ids):
+            self._level_numbers.setdefault(level_id, level_number)
+        intervals = dict()
+        for definition_number, scope in enumerate(scopes):
+            intervals.setdefault(self._get_interval(scope), []).append(definition_number)
+        # Outer intervals first among the ones starting at the same level
+        self._intervals = sorted(intervals, key=lambda i: (i[0], -i[1]))
+        self._interval_starts = [start for start, _ in self._intervals]
+        self._interval_definitions = [intervals[i] for i in self._intervals]
+        # Closest interval enclosing each interval, or -1
+        self._interval_parents = []
+        enclosing = []
+        for start, end in self._intervals:
+            while enclosing and self._intervals[enclosing[-1]][1] <= start:
+                enclosing.pop()
+            self._interval_parents.append(enclosing[-1] if enclosing else -1)
+            enclosing.append(len(self._interval_parents) - 1)
+
+    def _get_interval(self, scope):
+        if scope == -1:
+            return 0, len(self.level_ids)
+        return scope, self.subtree_ends[scope]
+
+    @staticmethod
+    def build(crawler):
+        level_ids = []
+        subtree_ends = array('i')
+        definitions = []
+        scopes = []
+
+        def add_level(level, ancestors, inherited_scope, fragments):
+            # Numbers the levels of the subtree, and adds (level number,
+            # ancestors, inherited scope, text) to fragments for each sentence
+            # fragment, in the order of Level.get_sentence_fragments
+            level_number = len(level_ids)
+            level_ids.append(level.id.val)
+            subtree_ends.append(0)
+            ancestors = ancestors + [(level_number, level.tag)]
+            own_texts = [level.chapeau, level.content]
+            for text in own_texts:
+                if text is not None:
+                    fragments.append((level_number, ancestors, inherited_scope, text))
+            # Lead-ins of the chapeau introduce the sublevels
+            sublevels_scope = inherited_scope
+            if level.chapeau is not None:
+                for _, lead_in_scope in find_lead_ins(level.chapeau, ancestors):
+                    sublevels_scope = lead_in_scope
+            for c in level.sublevels.values():
+                add_level(c[0], ancestors, sublevels_scope, fragments)
+                if c[1] is not None:
+                    fragments.append((level_number, ancestors, inherited_scope, c[1]))
+            if level.continuation is not None:
+                fragments.append((level_number, ancestors, inherited_scope, level.continuation))
+            subtree_ends[level_number] = len(level_ids)
+
+        section_ancestors = get_section_ancestors(crawler)
+        # (identifier, tag, level number) of the levels above the last section
+        above_levels = []
+
+        def close_above_levels(count):
+            while len(above_levels) > count:
+                subtree_ends[above_levels.pop()[2]] = len(level_ids)
+
+        for section in crawler.iterate_over_sections():
+            ancestors = section_ancestors.get(section.id.val, [])
+            shared = 0
+            while shared < min(len(above_levels), len(ancestors)) and \
+                    above_levels[shared][0] == ancestors[shared][0]:
+                shared += 1
+            close_above_levels(shared)
+            for identifier, tag in ancestors[shared:]:
+                above_levels.append((identifier, tag, len(level_ids)))
+                level_ids.append(identifier)
+                subtree_ends.append(0)
+            fragments = []
+            add_level(section, [(level_number, tag) for _, tag, level_number in above_levels],
+                      len(level_ids), fragments)
+            for definition, scope in get_section_definitions(section, fragments):
+                definitions.append(definition)
+                scopes.append(scope)
+        close_above_levels(0)
+        return DefinitionScopeIndex(level_ids, subtree_ends, definitions, scopes)
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no index or if the XML changed since it was built
+        filepath = get_definition_scope_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            try:
+                data = marshal.load(f)
+            except (ValueError, EOFError, TypeError):
+                return None
+        if data.get("format") != DEFINITION_SCOPE_INDEX_FORMAT_VERSION or \
+                not corpus_snapshot.is_source_unchanged(data, xml_filepath):
+            return None
+        subtree_ends = array('i')
+        subtree_ends.fromstring(data["subtree_ends"])
+        return DefinitionScopeIndex(data["level_ids"], subtree_ends,
+                                    data["definitions"], data["scopes"])
+
+    @staticmethod
+    def load_or_build(crawler):
+        index = DefinitionScopeIndex.open(crawler.xml_filepath)
+        if index is None:
+            index = DefinitionScopeIndex.build(crawler)
+            try:
+                index.save(crawler.xml_filepath)
+            except (IOError, OSError) as e:
+                print(u"Warning: Unable to write definition scope index: {0}".format(e))
+        return index
+
+    def save(self, xml_filepath):
+        data = corpus_snapshot.get_source_info(xml_filepath)
+        data["format"] = DEFINITION_SCOPE_INDEX_FORMAT_VERSION
+        data["level_ids"] = self.level_ids
+        data["subtree_ends"] = self.subtree_ends.tostring()
+        data["definitions"] = self.definitions
+        data["scopes"] = self.scopes
+        filepath = get_definition_scope_index_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_filepath, filepath)
+
+    def get_scope_level_id(self, definition_number):
+        # Id of the level a definition is scoped to, None for the whole title
+        scope = self.scopes[definition_number]
+        return None if scope == -1 else self.level_ids[scope]
+
+    def get_applicable_definitions(self, level_id):
+        # Numbers of the definitions applicable at the level, from the
+        # outermost scope to the innermost, in document order within a scope
+        level_number = self._level_numbers.get(unicode(level_id))
+        if level_number is None:
+            return []
+        interval = bisect_right(self._interval_starts, level_number) - 1
+        chain = []
+        while interval != -1:
+            if self._intervals[interval][1] > level_number:
+                chain.append(interval)
+            interval = self._interval_parents[interval]
+        chain.reverse()
+        return [d for interval in chain for d in self._interval_definitions[interval]]
+
+    def get_level_definitions(self, level_id):
+        # Numbers of the definitions made at or below the level
+        level_number = self._level_numbers.get(unicode(level_id))
+        if level_number is None:
+            return []
+        end = self.subtree_ends[level_number]
+        return [d for d, definition in enumerate(self.definitions)
+                if level_number <= definition[4] < end]
+
+    def extract_definitions(self, level_id):
+        # Definitions applicable at the level, in the format of
+        # definition_extractor.extract_definitions. Terms defined again in an
+        # inner scope are suffixed with "#" like repeated definitions there.
+        defined_terms = []
+        definitions = OrderedDict()
+        for definition_number in self.get_applicable_definitions(level_id):
+            term, def_type, rest, sentence, _ = self.definitions[definition_number]
+            defined_terms.append(term)
+            while term in definitions:
+                term = u"{}#".format(term)
+            definitions[term] = {
+                "sentence": sentence,
+                "type": def_type,
+                "rest": rest
+            }
+        return defined_terms, definitions
+
+
+def check_definitions(index, crawler):
+    # Ids of the sections whose definitions in the index differ from the ones
+    # of definition_extractor.extract_definitions
+    mismatched_section_ids = []
+    for section in crawler.iterate_over_sections():
+        _, definitions = extract_definitions(section)
+        expected = [(d["type"], d["rest"], d["sentence"]) for d in definitions.values()]
+        found = [tuple(index.definitions[d][1:4])
+                 for d in index.get_level_definitions(section.id.val)]
+        if found != expected:
+            mismatched_section_ids.append(section.id.val)
+    return mismatched_section_ids
+
+def main(args):
+    from irc_crawler import IRCCrawler
+    crawler = IRCCrawler()
+    index = DefinitionScopeIndex.load_or_build(crawler)
+    if args.check:
+        mismatched_section_ids = check_definitions(index, crawler)
+        print(u"{0} sections with definitions different from extract_definitions".format(
+            len(mismatched_section_ids)))
+        for section_id in mismatched_section_ids:
+            print(section_id)
+        return
+    for definition_number in index.get_applicable_definitions(args.level_id):
+        term, def_type, _, _, level_number = index.definitions[definition_number]
+        scope_level_id = index.get_scope_level_id(definition_number)
+        print(u"{0} ({1}) defined in {2}, scope {3}".format(
+            term, def_type, index.level_ids[level_number],
+            u"title" if scope_level_id is None else scope_level_id))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="List the term definitions applicable at a level of the Internal Revenue Code.")
+    parser.add_argument("--level-id",
+                        type=str,
+                        default="s163/h/3/B",
+                        help="Specifies the level (section, subsection, paragraph, etc.) to find. " + \
+                              "Should have pattern s[section]/[subsection]/[paragraph]/[subparagraph]/[clause]/[subclause]/[item]. " + \
+                              "For example, 's163/h/1' specifies section 163, subsection h, paragraph 1.")
+    parser.add_argument("--check",
+                        action="store_true",
+                        help="Check that the definitions of every section are the ones of definition_extractor.extract_definitions instead.")
+    args = parser.parse_args()
+    main(args)
@@ -1,21 +1,18 @@
  # This Python file uses the following encoding: UTF-8
 from irc_crawler import IRCCrawler
 from definition_extractor import extract_defined_terms
+from term_index import DefinedTermIndex
+from term_counter import count_terms
 import matplotlib.pyplot as plt
 import numpy as np
 import operator
 import collections
 import matplotlib.patches as mpatches
-import os
 
-def make_freq_hist(level):
+def make_freq_hist(level, term_index):
     text = u'\n'.join(level.get_sentences())
-    num_defined_terms = []
     defined_terms = extract_defined_terms(level)
-    for x in defined_terms:
-        p = text.count(x)  # find the terms in text
-        num_defined_terms.append(p)  # add a number to a list called num_defined_terms
-    dictionary = dict(zip(defined_terms, num_defined_terms))  # match the defined term to their frequencies
+    dictionary = count_terms(text, defined_terms)  # match the defined term to their frequencies, in one pass over the text
     sorteddict = sorted(dictionary.items(),
                         key=operator.itemgetter(1))  # turn into tuple, sort by value(1) rather than key(0)
     sorteddict.reverse()  # make order descending
@@ -36,17 +33,9 @@ def make_freq_hist(level):
             realindex = keys.index(kword)
             colors[realindex] = 'r'
 
-    os.chdir('definition_stats')
-    file_object = open('defined_terms.txt', 'r')
-    irc = file_object.readlines()
-    irc_count = collections.Counter(irc)
-    irc_freq = irc_count.values()  # the frequencies themselves
-    irc_words = irc_count.keys()  # the words pertaining to each frequency
     for index, word in enumerate(section_words, start=0):
-        hi = word + '\n'
-        hii = irc_words.index(hi.encode('ascii', 'ignore'))  # indexes of each defined word.
-        h = section_words.index(word)
-        if irc_freq[hii] > section_freq[h]:
+        # number of definitions of the word in the whole IRC
+        if term_index.get_count(word) > section_freq[index]:
             kword = section_words[index]
             realindex = keys.index(kword)
             colors[realindex] = 'g'
@@ -71,7 +60,7 @@ def make_freq_hist(level):
 def main(args):
     crawler = IRCCrawler()
     level = crawler.get_level(args.level_id)
-    make_freq_hist(level)
+    make_freq_hist(level, DefinedTermIndex.load_or_build(crawler))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,160 @@
+import os
+import marshal
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+import corpus_snapshot
+import irc_crawler
+import parallel_corpus
+from rule_extractor import RULE_TYPES, HEADING_CLASSES, normalize_heading
+
+HEADING_INDEX_FORMAT_VERSION = 1
+
+
+def get_heading_index_filepath(xml_filepath):
+    return "{0}.headingindex".format(xml_filepath)
+
+def get_section_headings(section):
+    # (level id, normalized heading, sentences) of the levels of the section
+    # with a heading, in preorder. Sentences are only kept for rule headings.
+    headings = []
+    for level in section.preorder_transversal():
+        if level.heading is None:
+            continue
+        heading = normalize_heading(level.heading)
+        sentences = level.get_sentences() if heading in RULE_TYPES else None
+        headings.append((level.id.val, heading, sentences))
+    return headings
+
+
+class HeadingIndex(object):
+    # Normalized heading => levels with that heading, for the whole corpus.
+    # A class of headings is looked up as the union of its headings, so new
+    # classes in rule_extractor.HEADING_CLASSES need no new crawl. The
+    # sentences of levels with a rule heading are kept, so extracting rules
+    # only reads the index.
+    def __init__(self, section_ids, headed_levels, sentences):
+        # Ids of all crawled sections, in document order
+        self.section_ids = section_ids
+        # (level id, normalized heading) of the levels with a heading, in
+        # document order
+        self.headed_levels = headed_levels
+        # Level id => sentences, for the levels with a rule heading
+        self.sentences = sentences
+        self._postings = dict()
+        # Section id => range of its levels in headed_levels
+        self._section_ranges = dict()
+        for i, (level_id, heading) in enumerate(headed_levels):
+            self._postings.setdefault(heading, []).append(i)
+            section_id = level_id.split(u"/")[0]
+            start = self._section_ranges.get(section_id, (i, i))[0]
+            self._section_ranges[section_id] = (start, i + 1)
+
+    @staticmethod
+    def build(jobs=1, xml_filepath=irc_crawler.IRC_XML_FILEPATH):
+        section_ids = []
+        headed_levels = []
+        sentences = dict()
+        for section_id, headings in parallel_corpus.map_sections(
+                get_section_headings, jobs=jobs, xml_filepath=xml_filepath):
+            section_ids.append(section_id)
+            for level_id, heading, level_sentences in headings:
+                headed_levels.append((level_id, heading))
+                if level_sentences is not None:
+                    sentences[level_id] = level_sentences
+        return HeadingIndex(section_ids, headed_levels, sentences)
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no index or if the XML changed since it was built
+        filepath = get_heading_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            try:
+                data = marshal.load(f)
+            except (ValueError, EOFError, TypeError):
+                return None
+        if data.get("format") != HEADING_INDEX_FORMAT_VERSION or \
+                not corpus_snapshot.is_source_unchanged(data, xml_filepath):
+            return None
+        return HeadingIndex(data["section_ids"], data["headed_levels"], data["sentences"])
+
+    @staticmethod
+    def load_or_build(jobs=1, xml_filepath=irc_crawler.IRC_XML_FILEPATH):
+        index = HeadingIndex.open(xml_filepath)
+        if index is None:
+            index = HeadingIndex.build(jobs=jobs, xml_filepath=xml_filepath)
+            try:
+                index.save(xml_filepath)
+            except (IOError, OSError) as e:
+                print(u"Warning: Unable to write heading index: {0}".format(e))
+        return index
+
+    def save(self, xml_filepath):
+        data = corpus_snapshot.get_source_info(xml_filepath)
+        data["format"] = HEADING_INDEX_FORMAT_VERSION
+        data["section_ids"] = self.section_ids
+        data["headed_levels"] = self.headed_levels
+        data["sentences"] = self.sentences
+        filepath = get_heading_index_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_filepath, filepath)
+
+    def _find(self, headings, scope_level_id=None):
+        # Positions in headed_levels of the levels with one of the headings,
+        # at or below the scope level, in document order
+        positions = sorted(i for heading in set(headings) for i in self._postings.get(heading, []))
+        if scope_level_id is None:
+            return positions
+        scope_level_id = unicode(scope_level_id)
+        start, end = self._section_ranges.get(scope_level_id.split(u"/")[0], (0, 0))
+        positions = positions[bisect_left(positions, start):bisect_left(positions, end)]
+        prefix = scope_level_id + u"/"
+        return [i for i in positions
+                if self.headed_levels[i][0] == scope_level_id or
+                self.headed_levels[i][0].startswith(prefix)]
+
+    def find_levels(self, heading_class, scope_level_id=None):
+        # Ids of the levels whose heading is of the class, in document order
+        return [self.headed_levels[i][0]
+                for i in self._find(HEADING_CLASSES[heading_class], scope_level_id)]
+
+    def get_heading_counts(self):
+        # Normalized heading => number of levels with it, to pick headings
+        # for new classes
+        return Counter(heading for _, heading in self.headed_levels)
+
+    def extract_rules(self, level_id):
+        # Same as rule_extractor.extract_rules(crawler.get_level(level_id))
+        rules = OrderedDict()
+        for i in self._find(RULE_TYPES.keys(), level_id):
+            rule_level_id, heading = self.headed_levels[i]
+            level_rules = OrderedDict()
+            level_rules[RULE_TYPES[heading]] = self.sentences[rule_level_id]
+            rules[rule_level_id] = level_rules
+        return rules
+
+
+def main(args):
+    index = HeadingIndex.load_or_build(jobs=args.jobs)
+    for level_id in index.find_levels(args.heading_class, args.level_id):
+        print(level_id)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="List the levels of the Internal Revenue Code with a class of heading.")
+    parser.add_argument("heading_class",
+                        choices=HEADING_CLASSES.keys())
+    parser.add_argument("--level-id",
+                        type=str,
+                        default=None,
+                        help="Only list levels at or below this level, e.g. 's163'.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes reading headings when the index is built.")
+    args = parser.parse_args()
+    main(args)
@@ -3,7 +3,11 @@ from os.path import dirname, join, realpath
 from lxml import etree
 from collections import OrderedDict
 import re
-from nltk.tokenize import sent_tokenize, word_tokenize
+import hashlib
+from tokenization import sent_tokenize, word_tokenize
+import corpus_snapshot
+import text_index
+import section_index
 
 IRC_XML_FILEPATH = join(
     dirname(dirname(realpath(__file__))), "irc/xml/irc.xml")
@@ -11,6 +15,10 @@ TAGS = [
     "section", "subsection", "paragraph", "subparagraph", "clause",
     "subclause", "item", "subitem", "subsubitem"
 ]
+# "repealed" (288 counted) and "omitted" (2 counted) sections are skipped
+# Other statuses are "renumbered" (17 counted) and "reserved" (2 counted)
+# All other sections have no status.
+SKIPPED_SECTION_STATUSES = ["repealed", "omitted"]
 
 
 class LevelId:
@@ -86,12 +94,41 @@ class Level:
         self._sentences = None
         self._avg_tokens_per_sentence = None
         self._total_token_count = None
+        self._content_hash = None
+
+    @staticmethod
+    def _update_hash(sha1, text):
+        # Texts are delimited, so that moving text between fields changes the hash
+        if text is None:
+            sha1.update(b"\x00")
+            return
+        if isinstance(text, unicode):
+            text = text.encode("UTF-8")
+        sha1.update(b"\x01")
+        sha1.update(text)
+        sha1.update(b"\x00")
+
+    def get_content_hash(self):
+        # Merkle hash of the level's id (and so num), own texts and its
+        # sublevels' hashes, so any change below a level also changes its
+        # hash. Outputs are keyed by level id, so a renumbered level is changed.
+        if self._content_hash is None:
+            sha1 = hashlib.sha1()
+            for text in [self.id.val, self.tag, self.heading, self.chapeau,
+                         self.content, self.continuation]:
+                Level._update_hash(sha1, text)
+            for c in self.sublevels.values():
+                sublevel, continuation = c[0], c[1]
+                Level._update_hash(sha1, sublevel.get_content_hash())
+                Level._update_hash(sha1, continuation)
+            self._content_hash = sha1.hexdigest()
+        return self._content_hash
 
     def get_total_token_count(self, word_tokenizer=word_tokenize):
         if self._total_token_count is None:
             total_token_count = 0
             for sent_fragment in self.get_sentence_fragments():
-                total_token_count += word_tokenizer(sent_fragment)
+                total_token_count += len(word_tokenizer(sent_fragment))
             self._total_token_count = total_token_count
         return self._total_token_count
 
@@ -147,14 +184,177 @@ class Level:
         return unicode(self).encode("UTF-8")
 
 
+class LazyLevel(Level):
+    # Level whose texts and sublevels are only built on first access, by the
+    # hydrate(level, name) function of its source, and then kept like any other
+    # attribute. Walking the headings of a section does not stringify its texts.
+    LAZY_ATTRIBUTES = [
+        "heading", "chapeau", "content", "sublevels", "continuation"
+    ]
+
+    def __init__(self, id, tag, hydrate):
+        assert isinstance(id, LevelId)
+        assert tag in TAGS, u"Unknown tag: {0}".format(tag)
+        self.id = id
+        self.tag = tag
+        # Checked against the source when hydrated, see Level._validate
+        self.num = id.get_num()
+        self._hydrate = hydrate
+        # Lazy evaluation
+        self._sentence_fragments = None
+        self._sentences = None
+        self._avg_tokens_per_sentence = None
+        self._total_token_count = None
+        self._content_hash = None
+
+    def __getattr__(self, name):
+        # Only called for attributes that are not set yet
+        if name not in LazyLevel.LAZY_ATTRIBUTES:
+            raise AttributeError(name)
+        self._hydrate(self, name)
+        return self.__dict__[name]
+
+
+def flatten_level(level, records=None, parent=-1, key=None, continuation=None):
+    # Preorder list of plain tuples, each pointing to the position of its parent.
+    # key and continuation are the level's entry in its parent's sublevels.
+    if records is None:
+        records = []
+    position = len(records)
+    records.append((parent, key, continuation, level.id.val, level.tag,
+                    level.num, level.heading, level.chapeau, level.content,
+                    level.continuation))
+    for sublevel_num, c in level.sublevels.items():
+        flatten_level(c[0], records, position, sublevel_num, c[1])
+    return records
+
+
+def unflatten_level(records, root=0):
+    # Rebuilds the level at position root with all of its sublevels
+    levels = dict()
+    for position in xrange(root, len(records)):
+        parent, key, continuation, id, tag, num, heading, chapeau, content, \
+            level_continuation = records[position]
+        if position > root and parent < root:
+            # Preorder, so the subtree ends at the first level outside of it
+            break
+        level = Level(LevelId(id), tag, num, heading, chapeau, content,
+                      OrderedDict(), level_continuation)
+        if position > root:
+            levels[parent].sublevels[key] = [level, continuation]
+        levels[position] = level
+    return levels[root]
+
+
+def _hydrate_record_level(records, children, position):
+    def hydrate(level, name):
+        if "heading" not in level.__dict__:
+            num, heading, chapeau, content, continuation = records[position][5:]
+            sublevels = OrderedDict()
+            Level._validate(level.id, level.tag, num, heading, chapeau, content,
+                            sublevels, continuation)
+            level.heading = heading
+            level.chapeau = chapeau
+            level.content = content
+            level.continuation = continuation
+        if name == "sublevels":
+            sublevels = OrderedDict()
+            for child in children[position]:
+                key, child_continuation = records[child][1:3]
+                sublevels[key] = [
+                    _make_lazy_record_level(records, children, child),
+                    child_continuation
+                ]
+            level.sublevels = sublevels
+    return hydrate
+
+def _make_lazy_record_level(records, children, position):
+    record = records[position]
+    return LazyLevel(LevelId(record[3]), record[4],
+                     _hydrate_record_level(records, children, position))
+
+def unflatten_lazy_level(records, root=0):
+    # Same as unflatten_level, but sublevels are only built when accessed
+    children = [[] for _ in records]
+    for position in xrange(root + 1, len(records)):
+        parent = records[position][0]
+        if parent < root:
+            break
+        children[parent].append(position)
+    return _make_lazy_record_level(records, children, root)
+
+
+def get_title(document_identifier):
+    # "/us/usc/t26" => u"26"
+    prefix = section_index.USC_DOCUMENT_IDENTIFIER_PREFIX
+    assert document_identifier is not None and document_identifier.startswith(
+        prefix), u"Unknown document: {0}".format(document_identifier)
+    return unicode(document_identifier[len(prefix):])
+
+
 class IRCCrawler:
-    def __init__(self, default_namespace="USLM", debug=False):
-        self.tree = etree.parse(IRC_XML_FILEPATH)
-        self.root = self.tree.getroot()
+    # Works for any title of the United States Code, the title is read from
+    # the identifier of the document. Despite the name, IRC_XML_FILEPATH is
+    # only the default.
+    def __init__(self, default_namespace="USLM", debug=False,
+                 xml_filepath=IRC_XML_FILEPATH, use_snapshot=True, lazy=False,
+                 write_snapshot=False):
+        self.xml_filepath = xml_filepath
         self.default_namespace = default_namespace
-        self.nsmap = self.root.nsmap
-        self.nsmap[default_namespace] = self.nsmap.pop(None)
         self.debug = debug
+        # Levels are hydrated on first access, see LazyLevel
+        self.lazy = lazy
+        # Lazy evaluation, maps identifier => nodes with that identifier
+        self._level_node_index = None
+        self._text_index = None
+        self.tree = None
+        self.root = None
+        self.snapshot = None
+        # A missing or stale snapshot is only (re)built when asked for, opening
+        # a crawler never writes next to the XML otherwise
+        if use_snapshot:
+            self.snapshot = corpus_snapshot.CorpusSnapshot.open(xml_filepath)
+        if self.snapshot is None:
+            root = self._get_root()
+            self._set_document(root.nsmap,
+                               section_index.get_document_identifier(root))
+            if write_snapshot:
+                self._write_snapshot()
+        else:
+            self._set_document(*section_index.read_document_root(xml_filepath))
+
+    def _get_root(self):
+        # Crawlers opened from a snapshot only parse the XML when the tree is
+        # needed, e.g. by _iterate_over_nodes
+        if self.root is None:
+            self.tree = etree.parse(self.xml_filepath)
+            self.root = self.tree.getroot()
+        return self.root
+
+    def _set_document(self, nsmap, document_identifier):
+        self.nsmap = dict(nsmap)
+        self.nsmap[self.default_namespace] = self.nsmap.pop(None)
+        self.title = get_title(document_identifier)
+        self.identifier_prefix = u"{0}/".format(document_identifier)
+
+    def _write_snapshot(self):
+        def sections():
+            for node in self._iterate_over_nodes(tags=["section"]):
+                try:
+                    level = self._parse_level(node)
+                except LevelHasNoIdException:
+                    continue
+                except AssertionError:
+                    # Some skipped sections are malformed, they are never crawled
+                    if node.get("status") in SKIPPED_SECTION_STATUSES:
+                        continue
+                    raise
+                yield (level.id.get_section_id(), node.get("status"),
+                       flatten_level(level))
+        try:
+            corpus_snapshot.write_snapshot(self.xml_filepath, sections())
+        except (IOError, OSError) as e:
+            print(u"Warning: Unable to write snapshot: {0}".format(e))
 
     def _namespace_prefix(self):
         return "{{{0}}}".format(self.nsmap[self.default_namespace])
@@ -163,60 +363,80 @@ class IRCCrawler:
         return etree.tostring(
             node, method="text", encoding="UTF-8").strip().decode("UTF-8")
 
+    def _build_level_node_index(self):
+        # Single pass over the tree, instead of one XPath scan per lookup
+        index = dict()
+        for node in self._get_root().iter("{0}*".format(self._namespace_prefix())):
+            identifier = node.get("identifier")
+            if identifier is not None:
+                index.setdefault(identifier, []).append(node)
+        return index
+
     def _get_level_node(self, level_id):
         assert isinstance(level_id, LevelId)
-        xpath_expression = "//{0}:*[@identifier='/us/usc/t26/{1}']".format(
-            self.default_namespace, level_id)
-        nodes = self.root.xpath(xpath_expression, namespaces=self.nsmap)
+        if self._level_node_index is None:
+            self._level_node_index = self._build_level_node_index()
+        nodes = self._level_node_index.get(
+            u"{0}{1}".format(self.identifier_prefix, level_id.val), [])
         assert len(nodes) <= 1
         if len(nodes) == 0:
             raise LevelDoesNotExistException()
         return nodes[0]
 
-    def _parse_level(self, node):
+    def _parse_level_id(self, node):
         if node.get("identifier") is None:
             # Happens for some quoted sections that appear in the "notes"
             raise LevelHasNoIdException()
-        identifier_prefix = u"/us/usc/t26/"
+        identifier_prefix = self.identifier_prefix
         assert node.get("identifier").startswith(identifier_prefix)
         id = LevelId(node.get("identifier").replace(identifier_prefix, '', 1))
         ns_prefix = self._namespace_prefix()
         assert node.tag.startswith(ns_prefix)
         tag = node.tag.replace(ns_prefix, '', 1)
+        return id, tag
+
+    def _parse_level_children(self, node, id, parse_sublevel):
+        # One pass over the direct children of a level. Returns its num, the
+        # heading, chapeau and content nodes, its sublevels (built with
+        # parse_sublevel) and its continuation.
+        ns_prefix = self._namespace_prefix()
         num = None
-        level = {
+        text_nodes = {
             "heading": None,
             "chapeau": None,
-            "content": None,
-            "continuation": None
+            "content": None
         }
+        level_continuation = None
         sublevels = OrderedDict()
         for c in node:
             c_tag = c.tag.replace(ns_prefix, '', 1)
             if c_tag == "num":
                 assert num is None, u"Repeated num in level {}".format(id)
                 num = c.get("value")
-            elif c_tag in level:
-                if c_tag == "continuation":
-                    continuation = self._stringify_node(c)
-                    if len(sublevels) == 0:
-                        assert level["continuation"] is None
-                        level["continuation"] = continuation
-                    else:
-                        # Continuations can be "sandwiched" between sublevels
-                        # See 10.4 in http://xml.house.gov/schemas/uslm/1.0/USLM-User-Guide.pdf
-                        prev_sublevel_num = next(reversed(sublevels))
-                        prev_sublevel_and_continuation = sublevels[
-                            prev_sublevel_num]
-                        if prev_sublevel_and_continuation[1] is None:
-                            prev_sublevel_and_continuation[1] = continuation
-                        else:
-                            assert level["continuation"] is None
-                            level["continuation"] = continuation
+            elif c_tag in text_nodes:
+                text_nodes[c_tag] = c
+            elif c_tag == "continuation":
+                continuation = self._stringify_node(c)
+                if len(sublevels) == 0:
+                    assert level_continuation is None
+                    level_continuation = continuation
                 else:
-                    level[c_tag] = self._stringify_node(c)
+                    # Continuations can be "sandwiched" between sublevels
+                    # See 10.4 in http://xml.house.gov/schemas/uslm/1.0/USLM-User-Guide.pdf
+                    prev_sublevel_num = next(reversed(sublevels))
+                    prev_sublevel_and_continuation = sublevels[
+                        prev_sublevel_num]
+                    if prev_sublevel_and_continuation[1] is None:
+                        prev_sublevel_and_continuation[1] = continuation
+                    else:
+                        assert level_continuation is None
+                        level_continuation = continuation
             elif c_tag in TAGS:
-                sublevel = self._parse_level(c)
+                try:
+                    sublevel = parse_sublevel(c)
+                except LevelHasNoIdException:
+                    # Skipped, in lazy levels too when they are hydrated
+                    continue
                 sublevel_num = sublevel.num
                 # Apparently, there exist some levels with the same name
                 while sublevel_num in sublevels:
@@ -225,56 +445,209 @@ class IRCCrawler:
                 sublevels[sublevel_num] = [sublevel, None]
             elif self.debug:
                 print(u"Warning: Skipping element with tag {0}".format(c.tag))
-        return Level(id, tag, num, level["heading"], level["chapeau"],
-                     level["content"], sublevels, level["continuation"])
+        return num, text_nodes, sublevels, level_continuation
+
+    def _stringify_text_node(self, text_node):
+        if text_node is None:
+            return None
+        return self._stringify_node(text_node)
+
+    def _parse_level(self, node):
+        id, tag = self._parse_level_id(node)
+        num, text_nodes, sublevels, continuation = self._parse_level_children(
+            node, id, self._parse_level)
+        return Level(id, tag, num,
+                     self._stringify_text_node(text_nodes["heading"]),
+                     self._stringify_text_node(text_nodes["chapeau"]),
+                     self._stringify_text_node(text_nodes["content"]),
+                     sublevels, continuation)
+
+    def _hydrate_lazy_level(self, level, node, name):
+        if "_text_nodes" not in level.__dict__:
+            # Direct children only, sublevels are lazy too
+            num, text_nodes, sublevels, continuation = self._parse_level_children(
+                node, level.id, self._parse_lazy_level)
+            assert num == level.num
+            level._text_nodes = text_nodes
+            level.sublevels = sublevels
+            level.continuation = continuation
+        if name in level._text_nodes:
+            text = self._stringify_text_node(level._text_nodes[name])
+            setattr(level, name, text)
+
+    def _parse_lazy_level(self, node):
+        # Sublevels without id are skipped when the level is hydrated, as
+        # _parse_level does
+        id, tag = self._parse_level_id(node)
+        return LazyLevel(
+            id, tag,
+            lambda level, name: self._hydrate_lazy_level(level, node, name))
 
     def _iterate_over_nodes(self, tags=[]):
         for t in tags:
             assert t in TAGS, u"Unknown tag: {}".format(t)
         tags = ["{0}{1}".format(self._namespace_prefix(), t) for t in tags]
-        for node in self.root.iter(*tags):
+        for node in self._get_root().iter(*tags):
             yield node
 
+    def _get_snapshot_level(self, level_id):
+        # Ids are unique, as in _get_level_node
+        matches = []
+        for records in self.snapshot.get_section_records(
+                level_id.get_section_id()):
+            for position, record in enumerate(records):
+                if record[3] == level_id.val:
+                    matches.append((records, position))
+        assert len(matches) <= 1
+        if len(matches) == 0:
+            raise LevelDoesNotExistException()
+        records, position = matches[0]
+        if self.lazy:
+            return unflatten_lazy_level(records, position)
+        return unflatten_level(records, position)
+
     def get_level(self, level_id):
         level_id = LevelId(level_id)
+        if self.snapshot is not None:
+            return self._get_snapshot_level(level_id)
         level_node = self._get_level_node(level_id)
+        if self.lazy:
+            return self._parse_lazy_level(level_node)
         level = self._parse_level(level_node)
         return level
 
     def iterate_over_sections(self):
+        if self.snapshot is not None:
+            for _, status, records in self.snapshot.iterate_over_sections():
+                if status in SKIPPED_SECTION_STATUSES:
+                    continue
+                if self.lazy:
+                    yield unflatten_lazy_level(records)
+                else:
+                    yield unflatten_level(records)
+            return
         for node in self._iterate_over_nodes(tags=["section"]):
-            if node.get("status") in ["repealed", "omitted"]:
-                # Skip "repealed" (288 counted) and "omitted" (2 counted) sections
-                # Other statuses are "renumbered" (17 counted) and "reserved" (2 counted)
-                # All other sections have no status.
+            if node.get("status") in SKIPPED_SECTION_STATUSES:
                 continue
             try:
-                level = self._parse_level(node)
+                if self.lazy:
+                    level = self._parse_lazy_level(node)
+                else:
+                    level = self._parse_level(node)
             except LevelHasNoIdException:
                 continue
             yield level
 
-    # def find_levels_by_text(self, text, scope_level_id, tag="*"):
-    #     text = text.lower()
-    #     scope_level_id = LevelId(scope_level_id)
-    #     scope_node = self._get_level_node(scope_level_id)
-    #     tag = "{0}:{1}".format(self.default_namespace, tag)
-    #     to_lowercase = "translate(., 'ABCDEFGHIJKLMNOPQRSTUVWXYZ', 'abcdefghijklmnopqrstuvwxyz')"
-    #     xpath_expression = ".//{0}[text()[contains({1}, '{2}')]]".format(tag, to_lowercase, text)
-    #     nodes = scope_node.xpath(xpath_expression, namespaces=self.nsmap)
-    #     levels = []
-    #     for node in nodes:
-    #         level_node = node
-    #         while level_node.get("identifier") is None:
-    #             level_node = level_node.getparent()
-    #         level = self._parse_level(level_node)
-    #         levels.append(level)
-    #     return levels
+    def find_levels_by_text(self, text, scope_level_id):
+        # Levels at or below the scope whose own texts contain the phrase,
+        # looked up in the inverted index instead of the XML tree
+        if self._text_index is None:
+            self._text_index = text_index.TextIndex.load_or_build(self)
+        level_ids = self._text_index.search_phrase(text, LevelId(scope_level_id).val)
+        return [self.get_level(level_id) for level_id in level_ids]
+
+
+class IRCStreamingCrawler(IRCCrawler):
+    # Never holds the whole tree: sections are parsed one at a time with
+    # iterparse and freed once yielded, so memory is bounded by the largest
+    # section instead of the whole title.
+    def __init__(self, default_namespace="USLM", debug=False,
+                 xml_filepath=IRC_XML_FILEPATH):
+        self.xml_filepath = xml_filepath
+        self.tree = None
+        self.root = None
+        self.default_namespace = default_namespace
+        self._set_document(*section_index.read_document_root(xml_filepath))
+        self.debug = debug
+        # Sections are cleared once yielded, so their levels can't be lazy
+        self.lazy = False
+        self._level_node_index = None
+        self._text_index = None
+        self.snapshot = None
+
+    def _iterate_over_top_level_section_nodes(self):
+        section_tag = "{0}section".format(self._namespace_prefix())
+        depth = 0
+        for event, node in etree.iterparse(
+                self.xml_filepath, events=("start", "end"), tag=section_tag):
+            if event == "start":
+                depth += 1
+                continue
+            depth -= 1
+            if depth > 0:
+                # Quoted section nested in another one, handled with its parent
+                continue
+            yield node
+            # Free the section and everything parsed before it
+            node.clear()
+            while node.getprevious() is not None:
+                del node.getparent()[0]
+
+    def _iterate_over_nodes(self, tags=[]):
+        # Only finds nodes within sections, which is where all levels live
+        for t in tags:
+            assert t in TAGS, u"Unknown tag: {}".format(t)
+        tags = ["{0}{1}".format(self._namespace_prefix(), t) for t in tags]
+        for section_node in self._iterate_over_top_level_section_nodes():
+            for node in section_node.iter(*tags):
+                yield node
+
+    def get_level(self, level_id):
+        level_id = LevelId(level_id)
+        identifier = u"{0}{1}".format(self.identifier_prefix, level_id.val)
+        any_tag = "{0}*".format(self._namespace_prefix())
+        for section_node in self._iterate_over_top_level_section_nodes():
+            for node in section_node.iter(any_tag):
+                if node.get("identifier") == identifier:
+                    return self._parse_level(node)
+        raise LevelDoesNotExistException()
+
+
+class IRCSeekingCrawler(IRCStreamingCrawler):
+    # Never parses the whole title either: sections are located with the byte
+    # offsets of a SectionIndex and only the ones that are needed are parsed,
+    # so looking up one level costs time proportional to its section's size.
+    def __init__(self, default_namespace="USLM", debug=False,
+                 xml_filepath=IRC_XML_FILEPATH, lazy=False):
+        self.xml_filepath = xml_filepath
+        self.tree = None
+        self.root = None
+        self.default_namespace = default_namespace
+        self.section_index = section_index.SectionIndex.load_or_build(
+            xml_filepath)
+        self._set_document(self.section_index.nsmap,
+                           self.section_index.document_identifier)
+        self.debug = debug
+        # Sections are parsed independently, so their levels can be lazy
+        self.lazy = lazy
+        self._level_node_index = None
+        self._text_index = None
+        self.snapshot = None
+
+    def _iterate_over_top_level_section_nodes(self):
+        for position in xrange(len(self.section_index.sections)):
+            yield self.section_index.parse_section(position)
+
+    def get_level(self, level_id):
+        level_id = LevelId(level_id)
+        identifier = u"{0}{1}".format(self.identifier_prefix, level_id.val)
+        section_identifier = u"{0}{1}".format(self.identifier_prefix,
+                                              level_id.get_section_id())
+        any_tag = "{0}*".format(self._namespace_prefix())
+        for position in self.section_index.get_section_positions(
+                section_identifier):
+            section_node = self.section_index.parse_section(position)
+            for node in section_node.iter(any_tag):
+                if node.get("identifier") == identifier:
+                    if self.lazy:
+                        return self._parse_lazy_level(node)
+                    return self._parse_level(node)
+        raise LevelDoesNotExistException()
 
 
 def validate_sections(crawler=None):
     if crawler is None:
-        crawler = IRCCrawler()
+        crawler = IRCStreamingCrawler()
     count = 0
     for section in crawler.iterate_over_sections():
         count += 1
@@ -283,7 +656,7 @@ def validate_sections(crawler=None):
 
 def get_sections_ordered_by_average_tokens_per_sentence(crawler=None):
     if crawler is None:
-        crawler = IRCCrawler()
+        crawler = IRCStreamingCrawler()
     section_num_avg_tokens_per_sent_pairs = []
     for section in crawler.iterate_over_sections():
         average_tokens_per_sentence = section.get_average_tokens_per_sentence()
@@ -294,10 +667,12 @@ def get_sections_ordered_by_average_tokens_per_sentence(crawler=None):
 
 
 def main(args):
-    crawler = IRCCrawler()
+    import corpus_store
+    # Only parses the section of the level
+    crawler = corpus_store.get_crawler(IRC_XML_FILEPATH, IRCSeekingCrawler)
     level = crawler.get_level(args.level_id)
     print(level)
-    # levels = crawler.find_levels_by_text("general", args.level_id, tag="heading")
+    # levels = crawler.find_levels_by_text("general rule", args.level_id)
     # for level in levels:
     #     print("*"*5)
     #     print(level)
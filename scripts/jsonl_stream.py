@@ -0,0 +1,64 @@
+import os
+import json
+
+
+def get_checkpoint_filepath(filepath):
+    return "{0}.checkpoint".format(filepath)
+
+def iterate_over_records(filepath):
+    # Records of a JSON lines file, one at a time. A last line without its
+    # newline was cut by a crash and is skipped.
+    with open(filepath, 'r') as f:
+        for line in f:
+            if not line.endswith("\n"):
+                break
+            yield json.loads(line)
+
+
+class JSONLWriter(object):
+    # Writes records to a JSON lines file as they are produced. After each
+    # input item (e.g. a section) is done, checkpoint() saves how many items
+    # are done and where the file ends. With resume, the file is cut back to
+    # the last checkpoint and position is the number of items to skip.
+    def __init__(self, filepath, resume=False):
+        self.filepath = filepath
+        self.checkpoint_filepath = get_checkpoint_filepath(filepath)
+        self.position = 0
+        offset = 0
+        if resume and os.path.exists(self.checkpoint_filepath):
+            with open(self.checkpoint_filepath, 'r') as f:
+                checkpoint = json.load(f)
+            self.position = checkpoint["position"]
+            offset = checkpoint["offset"]
+        if offset > 0:
+            self._file = open(filepath, 'r+b')
+            self._file.truncate(offset)
+            self._file.seek(offset)
+        else:
+            self._file = open(filepath, 'wb')
+            self._save_checkpoint()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def write(self, record):
+        self._file.write(json.dumps(record, sort_keys=True))
+        self._file.write("\n")
+
+    def checkpoint(self):
+        # Records written before this call are kept when resuming
+        self.position += 1
+        self._file.flush()
+        self._save_checkpoint()
+
+    def _save_checkpoint(self):
+        tmp_filepath = "{0}.tmp{1}".format(self.checkpoint_filepath, os.getpid())
+        with open(tmp_filepath, 'w') as f:
+            json.dump({"position": self.position, "offset": self._file.tell()}, f)
+        os.rename(tmp_filepath, self.checkpoint_filepath)
+
+    def close(self):
+        self._file.close()
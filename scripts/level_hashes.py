@@ -0,0 +1,73 @@
+import json
+from collections import OrderedDict
+from irc_crawler import IRCCrawler
+
+
+def compute_level_hashes(crawler):
+    # Level id => content hash, for every level of every crawled section. A
+    # level id seen again is suffixed with "#" for each earlier occurrence, so
+    # no level is lost.
+    level_hashes = OrderedDict()
+    for section in crawler.iterate_over_sections():
+        for level in section.preorder_transversal():
+            level_id = level.id.val
+            while level_id in level_hashes:
+                level_id = u"{}#".format(level_id)
+            level_hashes[level_id] = level.get_content_hash()
+    return level_hashes
+
+def diff_level_hashes(old_hashes, new_hashes):
+    added = [level_id for level_id in new_hashes if level_id not in old_hashes]
+    removed = [level_id for level_id in old_hashes if level_id not in new_hashes]
+    changed = [
+        level_id for level_id in new_hashes
+        if level_id in old_hashes and old_hashes[level_id] != new_hashes[level_id]
+    ]
+    return added, removed, changed
+
+def only_sections(level_ids):
+    return [level_id for level_id in level_ids if u'/' not in level_id]
+
+def main(args):
+    old_hashes = compute_level_hashes(IRCCrawler(xml_filepath=args.old_xml))
+    new_hashes = compute_level_hashes(IRCCrawler(xml_filepath=args.new_xml))
+    added, removed, changed = diff_level_hashes(old_hashes, new_hashes)
+    if args.sections_only:
+        added, removed, changed = only_sections(added), only_sections(removed), only_sections(changed)
+
+    for label, level_ids in [("A", added), ("R", removed), ("M", changed)]:
+        for level_id in level_ids:
+            print(u"{0} {1}".format(label, level_id))
+    print("{} added, {} removed, {} changed".format(len(added), len(removed), len(changed)))
+
+    if args.output_file is not None:
+        diff = OrderedDict([
+            ("added", added),
+            ("removed", removed),
+            ("changed", changed),
+            ("hashes", new_hashes)
+        ])
+        with open(args.output_file, 'w') as f:
+            json.dump(diff, f, indent=4, encoding="UTF-8")
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="List levels added, removed or changed between two releases of the Internal Revenue Code.")
+    parser.add_argument("--old-xml",
+                        type=str,
+                        required=True,
+                        help="XML file of the previous release point.")
+    parser.add_argument("--new-xml",
+                        type=str,
+                        required=True,
+                        help="XML file of the new release point.")
+    parser.add_argument("--sections-only",
+                        action="store_true",
+                        help="Only list sections, i.e. the units downstream stages reprocess.")
+    parser.add_argument("--output-file",
+                        type=str,
+                        default=None,
+                        help="Also write the diff and the new release's level hashes as JSON.")
+    args = parser.parse_args()
+    main(args)
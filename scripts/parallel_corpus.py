@@ -0,0 +1,70 @@
+import multiprocessing
+import irc_crawler
+import corpus_snapshot
+
+# Crawler of the current worker process, see _init_worker
+_crawler = None
+
+
+def _init_worker(xml_filepath):
+    global _crawler
+    _crawler = irc_crawler.IRCCrawler(xml_filepath=xml_filepath)
+
+def _process_chunk(args):
+    func, positions = args
+    results = []
+    for position in positions:
+        _, _, records = _crawler.snapshot.get_section(position)
+        section = irc_crawler.unflatten_level(records)
+        results.append((section.id.val, func(section)))
+    return results
+
+def get_section_positions(snapshot):
+    # Positions in the snapshot of the sections crawled by iterate_over_sections
+    positions = []
+    for position, section in enumerate(snapshot.sections):
+        if section[1] not in irc_crawler.SKIPPED_SECTION_STATUSES:
+            positions.append(position)
+    return positions
+
+def chunk_positions(positions, chunk_size):
+    return [positions[i:i + chunk_size] for i in xrange(0, len(positions), chunk_size)]
+
+def map_sections(func, jobs=1, chunk_size=None, xml_filepath=irc_crawler.IRC_XML_FILEPATH,
+                 start=0):
+    # Yields (section id, func(section)) for every crawled section, in document
+    # order whatever the number of jobs. func must be picklable, i.e. defined
+    # at the top level of a module, and so must its results. The first start
+    # sections are skipped, e.g. when resuming an interrupted dump.
+    if jobs == 1:
+        crawler = irc_crawler.IRCStreamingCrawler(xml_filepath=xml_filepath)
+        for i, section in enumerate(crawler.iterate_over_sections()):
+            if i >= start:
+                yield section.id.val, func(section)
+        return
+    # Builds the snapshot if needed, workers then only have to open it
+    snapshot = irc_crawler.IRCCrawler(xml_filepath=xml_filepath,
+                                      write_snapshot=True).snapshot
+    if snapshot is None:
+        snapshot = corpus_snapshot.CorpusSnapshot.open(xml_filepath)
+    assert snapshot is not None, "Parallel crawling needs a corpus snapshot."
+    positions = get_section_positions(snapshot)[start:]
+    snapshot.close()
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    if chunk_size is None:
+        # A few chunks per worker, so that long sections even out
+        chunk_size = max(1, len(positions) // (4 * jobs))
+    chunks = chunk_positions(positions, chunk_size)
+    pool = multiprocessing.Pool(jobs, initializer=_init_worker, initargs=(xml_filepath, ))
+    try:
+        # imap returns chunks in submission order, i.e. document order
+        for results in pool.imap(_process_chunk, [(func, chunk) for chunk in chunks]):
+            for result in results:
+                yield result
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
@@ -2,10 +2,14 @@ import os
 from os.path import dirname, join, realpath
 import subprocess
 import amr_utils
+import parse_cache
 
 CORNELL_AMR_DIR = join(
     dirname(dirname(realpath(__file__))), "tools/cornell-amr")
 CAMR_DIR = join(dirname(dirname(realpath(__file__))), "tools/camr")
+# Models of the parsers, part of the parse cache key
+CORNELL_AMR_MODEL = "amr.sp"
+CAMR_MODEL = "amr-anno-1.0.train.basic-abt-brown-verb.m"
 
 
 def prepare_input_file(filedir, sentences):
@@ -32,7 +36,7 @@ def cornell_amr_parse(sentences, debug=False):
         "java", "-Xmx8g", "-jar",
         "{0}/dist/amr-1.0.jar".format(CORNELL_AMR_DIR), "parse",
         "rootDir={0}".format(CORNELL_AMR_DIR),
-        "modelFile={0}/amr.sp".format(CORNELL_AMR_DIR),
+        "modelFile={0}/{1}".format(CORNELL_AMR_DIR, CORNELL_AMR_MODEL),
         "sentences={0}".format(input_filepath),
         "logLevel={0}".format(log_level)
     ]
@@ -65,7 +69,7 @@ def camr_parse(sentences, debug=False):
     args = [
         "python", "{0}/amr_parsing.py".format(CAMR_DIR), "-m", "parse",
         "--model",
-        "{0}/amr-anno-1.0.train.basic-abt-brown-verb.m".format(CAMR_DIR),
+        "{0}/{1}".format(CAMR_DIR, CAMR_MODEL),
         input_filepath
     ]
     process = subprocess.Popen(
@@ -78,12 +82,37 @@ def camr_parse(sentences, debug=False):
     return output
 
 
-def parse_amr(sentences, parser="camr", debug=False):
-    if parser == "cornell-amr":
-        return cornell_amr_parse(sentences, debug=debug)
-    if parser == "camr":
-        return camr_parse(sentences, debug=debug)
-    raise Exception("Unknown parser: {0}".format(parser))
+PARSERS = {
+    "cornell-amr": (cornell_amr_parse, {"model": CORNELL_AMR_MODEL}),
+    "camr": (camr_parse, {"model": CAMR_MODEL})
+}
+
+
+def parse_amr(sentences, parser="camr", debug=False, use_cache=True):
+    # With use_cache, only the sentences not in the parse cache are parsed
+    if parser not in PARSERS:
+        raise Exception("Unknown parser: {0}".format(parser))
+    parse, options = PARSERS[parser]
+    if not use_cache:
+        return parse(sentences, debug=debug)
+    cache = parse_cache.get_default_cache()
+    amrs = [cache.get(parser, options, sentence) for sentence in sentences]
+    missing = [i for i, entry in enumerate(amrs) if entry is None or not entry[0]]
+    if len(missing) == 0:
+        return [output for _, output in amrs]
+    missing_sentences = [sentences[i] for i in missing]
+    # A failing run is not kept, it can not be told apart from a broken
+    # install (missing model, java, memory)
+    output = parse(missing_sentences, debug=debug)
+    if len(output) != len(missing_sentences):
+        # AMRs can not be matched to their sentences, nothing is kept
+        if len(missing) == len(sentences):
+            return output
+        return parse(sentences, debug=debug)
+    for i, sentence, amr in zip(missing, missing_sentences, output):
+        cache.put(parser, options, sentence, amr)
+        amrs[i] = (True, amr)
+    return [amr for _, amr in amrs]
 
 
 if __name__ == "__main__":
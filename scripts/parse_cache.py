@@ -0,0 +1,171 @@
+import os
+import json
+import marshal
+import hashlib
+import threading
+import unicodedata
+from os.path import dirname, join, realpath
+
+PARSE_CACHE_FORMAT_VERSION = 1
+PARSE_CACHE_DIR = join(dirname(dirname(realpath(__file__))), "parse_cache")
+# Default size of the entries of the cache, in bytes
+DEFAULT_MAX_SIZE = 256 << 20
+# Eviction removes entries until the cache is back under this share of its size
+EVICTION_RATIO = 0.9
+
+
+def normalize_sentence(sentence):
+    # Sentences differing only in spacing or unicode composition are parsed
+    # the same. Line breaks separate the sentences of a payload, so are kept.
+    if isinstance(sentence, str):
+        sentence = sentence.decode("UTF-8")
+    lines = [u" ".join(line.split()) for line in sentence.strip().splitlines()]
+    return unicodedata.normalize("NFC", u"\n".join(lines))
+
+def get_key(parser, options, sentence):
+    key = json.dumps([parser, options, normalize_sentence(sentence)], sort_keys=True)
+    return hashlib.sha1(key).hexdigest()
+
+
+class ParseCache(object):
+    # Outputs of the semantic parsers on disk, one file per (parser, options,
+    # normalized sentence), named by the hash of the three. A parser crash is
+    # kept as a negative entry with its error message. Entries are written to
+    # a temporary file and renamed, so concurrent writers (threads or
+    # processes) never leave a partial entry, and the last one wins. A hit
+    # touches the entry, and once the entries written by this process bring
+    # the cache over max_size, the least recently used entries are removed.
+    def __init__(self, cache_dir=PARSE_CACHE_DIR, max_size=DEFAULT_MAX_SIZE):
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        # Estimate of the size of the entries, from a scan of the directory
+        # and the entries written since
+        self._size = None
+        self._stats = {
+            "hits": 0,
+            "negative_hits": 0,
+            "misses": 0,
+            "writes": 0,
+            "evictions": 0
+        }
+        self._lock = threading.Lock()
+
+    def _get_entry_filepath(self, key):
+        return join(self.cache_dir, key[:2], key)
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self._stats[stat] += n
+
+    def get_stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+    def get(self, parser, options, sentence):
+        # (ok, output) of the sentence, None if it was never parsed. output is
+        # the error message of a negative entry.
+        filepath = self._get_entry_filepath(get_key(parser, options, sentence))
+        try:
+            with open(filepath, 'rb') as f:
+                entry = marshal.load(f)
+            os.utime(filepath, None)
+        except (IOError, OSError, ValueError, EOFError, TypeError):
+            # Missing, evicted meanwhile or unreadable
+            entry = None
+        if entry is None or entry.get("format") != PARSE_CACHE_FORMAT_VERSION or \
+                entry["sentence"] != normalize_sentence(sentence):
+            self._count("misses")
+            return None
+        self._count("hits" if entry["ok"] else "negative_hits")
+        return entry["ok"], entry["output"]
+
+    def put(self, parser, options, sentence, output, ok=True):
+        # Failing to write an entry only loses it, parsing goes on
+        key = get_key(parser, options, sentence)
+        blob = marshal.dumps({
+            "format": PARSE_CACHE_FORMAT_VERSION,
+            "parser": parser,
+            "options": options,
+            "sentence": normalize_sentence(sentence),
+            "ok": ok,
+            "output": output
+        })
+        filepath = self._get_entry_filepath(key)
+        tmp_filepath = "{0}.tmp{1}-{2}".format(filepath, os.getpid(), threading.current_thread().ident)
+        try:
+            if not os.path.isdir(dirname(filepath)):
+                try:
+                    os.makedirs(dirname(filepath))
+                except OSError:
+                    # Made by another writer meanwhile
+                    if not os.path.isdir(dirname(filepath)):
+                        raise
+            with open(tmp_filepath, 'wb') as f:
+                f.write(blob)
+            os.rename(tmp_filepath, filepath)
+        except (IOError, OSError) as e:
+            print(u"Warning: Unable to write parse cache entry: {0}".format(e))
+            return
+        self._count("writes")
+        with self._lock:
+            if self._size is not None:
+                self._size += len(blob)
+        if self._get_size() > self.max_size:
+            self.evict()
+
+    def _iterate_over_entries(self):
+        # (modification time, size, path) of the entries on disk
+        if not os.path.isdir(self.cache_dir):
+            return
+        for dirpath, _, filenames in os.walk(self.cache_dir):
+            for filename in filenames:
+                if ".tmp" in filename:
+                    continue
+                filepath = join(dirpath, filename)
+                try:
+                    stat = os.stat(filepath)
+                except OSError:
+                    continue
+                yield stat.st_mtime, stat.st_size, filepath
+
+    def _get_size(self):
+        with self._lock:
+            size = self._size
+        if size is None:
+            size = sum(entry_size for _, entry_size, _ in self._iterate_over_entries())
+            with self._lock:
+                self._size = size
+        return size
+
+    def evict(self):
+        # Removes the least recently used entries until the cache is under
+        # EVICTION_RATIO of max_size
+        entries = sorted(self._iterate_over_entries())
+        size = sum(entry_size for _, entry_size, _ in entries)
+        num_evictions = 0
+        for _, entry_size, filepath in entries:
+            if size <= self.max_size * EVICTION_RATIO:
+                break
+            try:
+                os.remove(filepath)
+                num_evictions += 1
+            except OSError:
+                # Evicted by another process meanwhile
+                pass
+            size -= entry_size
+        self._count("evictions", num_evictions)
+        with self._lock:
+            self._size = size
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def get_default_cache():
+    # Cache shared by the parser APIs of this process, so its counters cover
+    # all of them
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ParseCache()
+        return _default_cache
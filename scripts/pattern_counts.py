@@ -1,6 +1,7 @@
 # This Python file uses the following encoding: UTF-8
 import re
-import irc_crawler
+import time
+import parallel_corpus
 
 
 def regex(pattern, flags=re.UNICODE | re.IGNORECASE):
@@ -47,19 +48,53 @@ TERM_REGEX2 = regex(ur"the term (?:(“[^”]+”)|(‘[^’]+’))")
 TERM_REGEX3 = regex(ur"the term (?:(“[^”]+”)|(‘[^’]+’)) {0}".format(ALL_DEFINITION_TYPES_PATTERN))
 
 
-def count_pattern_matches(patterns):
-    crawler = irc_crawler.IRCCrawler()
+# Every pattern above only matches texts with this, sections without it are
+# not scanned
+REQUIRED_TEXT = u"the term"
+
+
+class PatternScanner(object):
+    # Counts the matches of every pattern in a section, and times each
+    # pattern. Instances are picklable, so sections can be scanned by
+    # parallel_corpus workers.
+    def __init__(self, patterns, required_text=REQUIRED_TEXT):
+        self.patterns = patterns
+        self.required_text = required_text
+
+    def __call__(self, section):
+        num_patterns = len(self.patterns)
+        match_counts = [0]*num_patterns
+        times = [0.0]*num_patterns
+        text = u" ".join(section.get_sentences())
+        if self.required_text is not None and self.required_text not in text.lower():
+            return match_counts, times
+        for i in xrange(num_patterns):
+            start = time.time()
+            # Counts without building the list of matches
+            for _ in self.patterns[i].finditer(text):
+                match_counts[i] += 1
+            times[i] = time.time() - start
+        return match_counts, times
+
+
+def count_pattern_matches(patterns, jobs=1):
+    # Match counts of the patterns over all sections, and for each pattern
+    # the total time spent matching it and the section it took longest on,
+    # (total time, max time, section id), to spot patterns that backtrack
     num_patterns = len(patterns)
     match_counts = [0]*num_patterns
-    for section in crawler.iterate_over_sections():
-        text = u" ".join(section.get_sentences())
+    pattern_times = [(0.0, 0.0, None)]*num_patterns
+    for section_id, (section_counts, section_times) in parallel_corpus.map_sections(
+            PatternScanner(patterns), jobs=jobs):
         for i in xrange(num_patterns):
-            pattern = patterns[i]
-            matches = pattern.findall(text)
-            match_counts[i] += len(matches)
-    return match_counts
+            match_counts[i] += section_counts[i]
+            total_time, max_time, max_section_id = pattern_times[i]
+            if section_times[i] > max_time:
+                max_time, max_section_id = section_times[i], section_id
+            pattern_times[i] = (total_time + section_times[i], max_time, max_section_id)
+    return match_counts, pattern_times
 
-def prepare_output(patterns, match_counts):
+def prepare_output(patterns, match_counts, pattern_times=None):
     assert len(patterns) == len(match_counts)
     num_patterns = len(patterns)
     output = []
@@ -67,6 +102,10 @@ def prepare_output(patterns, match_counts):
         pattern_str = patterns[i].pattern
         match_count = match_counts[i]
         output.append(u"PATTERN #{0}: /{1}/".format(i, pattern_str))
+        if pattern_times is not None:
+            total_time, max_time, max_section_id = pattern_times[i]
+            output.append(u"TIME #{0}: {1:.3f}s, slowest section {2} ({3:.3f}s)".format(
+                i, total_time, max_section_id, max_time))
         output.append(u"MATCH COUNT #{0}: {1}\n".format(i, match_count))
     return u"\n".join(output)
 
@@ -74,8 +113,8 @@ def main(args):
     patterns = [TERM_REGEX1, TERM_REGEX2, TERM_REGEX3]
     patterns += LEAD_INS_REGEXS
     patterns += TERM_DEFINITION_REGEXS
-    match_counts = count_pattern_matches(patterns)
-    output = prepare_output(patterns, match_counts)
+    match_counts, pattern_times = count_pattern_matches(patterns, jobs=args.jobs)
+    output = prepare_output(patterns, match_counts, pattern_times)
     with open(args.output_file, 'w') as f:
         f.write(output.encode("UTF-8"))
 
@@ -86,5 +125,9 @@ if __name__ == "__main__":
     parser.add_argument("--output-file",
                         type=str,
                         default="pattern_counts.txt")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes scanning sections, counts are identical for any number.")
     args = parser.parse_args()
     main(args)
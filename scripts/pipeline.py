@@ -1,5 +1,7 @@
 import irc_crawler
 import definition_extractor
+import definition_scope
+import heading_index
 import rule_extractor
 import candc_boxer_api
 import parse_amr
@@ -12,10 +14,12 @@ def parse_fol(sentences):
     ccboxer = candc_boxer_api.CCBoxerAPI()
     # drss = ccboxer.interpret(sentences)
     # Hack to make sure this doesn't fail because input is too large
-    drss = [ccboxer.interpret([sentence]) for sentence in sentences]
+    drss = ccboxer.interpret_many(sentences)
     # results = [drs.fol() for drs in drss]
     results = []
     for drs in drss:
+        if isinstance(drs, candc_boxer_api.CCBoxerAPIException):
+            raise drs
         assert len(drs) == 1
         results.append(drs[0].fol())
     return results
@@ -65,12 +69,22 @@ def main(args):
         # TODO #3
         # Need user to specify part of background theory.
         # However, this could actually be done later, when we actually want to "run" the default logic.
-        definitions_as_fol = definition_extractor.fol_definitions(level)
+        # Definitions applicable at the level, including the ones made in an
+        # ancestor for its whole subtree, e.g. "For purposes of this subsection",
+        # if there is a definition scope index. Building it would crawl the
+        # whole corpus, the level's own definitions are used otherwise.
+        scope_index = definition_scope.DefinitionScopeIndex.open(crawler.xml_filepath)
+        if scope_index is None:
+            definitions_as_fol = definition_extractor.fol_definitions(level)
+        else:
+            definitions_as_fol = definition_extractor.get_fol_definitions(
+                *scope_index.extract_definitions(level.id.val))
         background_theory = [
             Expression.fromstring(d["fol"]) for d in definitions_as_fol
         ]
 
         scope_level_id = level.id.get_section_id()
+        # Raises for unknown ids
         scope_level = crawler.get_level(scope_level_id)
         if args.dl_hack:
             if scope_level_id == "s163":
@@ -103,7 +117,13 @@ def main(args):
                     "Warning: Hard-coding option not a available for section {}.".
                     format(scope_level_id))
         else:
-            default_rules_sentences = rule_extractor.extract_rules(scope_level)
+            # Rule headings and their sentences are read from the heading index
+            # if there is one, building it would crawl the whole corpus
+            index = heading_index.HeadingIndex.open(crawler.xml_filepath)
+            if index is None:
+                default_rules_sentences = rule_extractor.extract_rules(scope_level)
+            else:
+                default_rules_sentences = index.extract_rules(scope_level_id)
 
             try:
                 default_rules = [
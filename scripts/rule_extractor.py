@@ -1,31 +1,87 @@
 import re
 from irc_crawler import IRCCrawler
+from jsonl_stream import JSONLWriter, iterate_over_records
 from collections import OrderedDict
 
+# Letters of a lowercased heading => type of the rules under it
+RULE_TYPES = OrderedDict([
+    ("generalrule", "general-rule"),
+    ("exceptions", "exceptions"),
+    ("specialrules", "special-rules")
+])
+# Class of heading => normalized headings of the class, the rule types and
+# other headings worth looking up. heading_index.HeadingIndex answers any
+# class added here without crawling again.
+HEADING_CLASSES = OrderedDict(
+    [(rule_type, [heading]) for heading, rule_type in RULE_TYPES.items()] + [
+    ("definitions", ["definitions", "definition", "otherdefinitions",
+                     "definitionsandspecialrules", "definitionsandspecialrule"]),
+    ("limitation", ["limitation", "limitations"]),
+    ("coordination", ["coordination", "coordinationwithothersections",
+                      "coordinationwithothercredits", "coordinationrules"])
+])
+NON_LETTERS_REGEX = re.compile("[^a-zA-Z]+", re.UNICODE)
+
 
 def only_letters(text):
-    pattern = re.compile("[^a-zA-Z]+", re.UNICODE)
-    return pattern.sub("", text)
+    return NON_LETTERS_REGEX.sub("", text)
+
+def normalize_heading(heading):
+    # Letters of the lowercased heading, e.g. u"General rule." => u"generalrule"
+    return only_letters(heading).lower()
+
+def get_rule_type(level):
+    # Rule type of the level's heading, None if it is not a rule heading
+    if level.heading is None:
+        return None
+    return RULE_TYPES.get(normalize_heading(level.heading))
 
 def extract_rules(level):
     rules = OrderedDict()
     for slevel in level.preorder_transversal():
-        if slevel.heading is None:
+        rule_type = get_rule_type(slevel)
+        if rule_type is None:
             continue
-        heading = only_letters(slevel.heading).lower()
         level_rules = OrderedDict()
-        if heading == "generalrule":
-            level_rules["general-rule"] = slevel.get_sentences()
-        elif heading == "exceptions":
-            level_rules["exceptions"] = slevel.get_sentences()
-        elif heading == "specialrules":
-            level_rules["special-rules"] = slevel.get_sentences()
-        if len(level_rules) > 0:
-            rules[slevel.id.val] = level_rules
+        level_rules[rule_type] = slevel.get_sentences()
+        rules[slevel.id.val] = level_rules
     return rules
 
+def get_rule_records(rules):
+    # (level id, rule type, sentence) of every rule returned by extract_rules
+    return [(level_id, rule_type, sentence)
+            for level_id, level_rules in rules.items()
+            for rule_type, sentences in level_rules.items()
+            for sentence in sentences]
+
+def dump_all_rules(output_filepath, jobs=1, resume=False):
+    # One line per rule of the whole IRC, an interrupted dump is continued with
+    # resume. Rules are read from the heading index like in rule_stats, which
+    # is built with jobs processes if needed. Returns the number of rules in
+    # the file, including the ones written before resuming.
+    # Imported here since heading_index imports this module
+    import heading_index
+    index = heading_index.HeadingIndex.load_or_build(jobs=jobs)
+    with JSONLWriter(output_filepath, resume=resume) as writer:
+        for section_id in index.section_ids[writer.position:]:
+            records = get_rule_records(index.extract_rules(section_id))
+            for level_id, rule_type, sentence in records:
+                writer.write({
+                    "level_id": level_id,
+                    "rule_type": rule_type,
+                    "sentence": sentence
+                })
+            writer.checkpoint()
+    return sum(1 for _ in iterate_over_records(output_filepath))
+
 def main(args):
-    crawler = IRCCrawler()
+    if args.all:
+        num_rules = dump_all_rules(args.output_file, jobs=args.jobs, resume=args.resume)
+        print("Info: {} rules written to {}.".format(num_rules, args.output_file))
+        return
+
+    # Only the texts of levels with a rule heading are read
+    crawler = IRCCrawler(lazy=True)
     level = crawler.get_level(args.level_id)
 
     rules = extract_rules(level)
@@ -51,5 +107,18 @@ if __name__ == "__main__":
                         help="Specifies the level (section, subsection, paragraph, etc.) to find. " + \
                               "Should have pattern s[section]/[subsection]/[paragraph]/[subparagraph]/[clause]/[subclause]/[item]. " + \
                               "For example, 's163/h/1' specifies section 163, subsection h, paragraph 1.")
+    parser.add_argument("--all",
+                        action="store_true",
+                        help="Extract the rules of the whole IRC to --output-file instead, one JSON line per rule.")
+    parser.add_argument("--output-file",
+                        type=str,
+                        default="rules.jsonl")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes building the heading index with --all if needed, the output is identical for any number.")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="Continue an interrupted --all run with the same output file.")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
@@ -0,0 +1,152 @@
+import os
+import re
+import mmap
+import marshal
+from lxml import etree
+import corpus_snapshot
+
+SECTION_INDEX_FORMAT_VERSION = 2
+# Start, end and empty tags of sections in the default namespace
+SECTION_TAG_REGEX = re.compile(br"<(/?)section(?=[\s/>])([^>]*?)(/?)>")
+ATTRIBUTE_REGEX = re.compile(br'([\w:-]+)\s*=\s*"([^"]*)"')
+# Identifiers of the documents of the United States Code, e.g. "/us/usc/t26"
+USC_DOCUMENT_IDENTIFIER_PREFIX = u"/us/usc/t"
+
+
+def get_section_index_filepath(xml_filepath):
+    return "{0}.sectionindex".format(xml_filepath)
+
+def get_document_identifier(root):
+    # Some documents have no identifier, only a number in their metadata.
+    # WebUI/WebUI/crawler.py has a Python 3 copy, to keep in step.
+    identifier = root.get("identifier")
+    if identifier is None:
+        namespace = etree.QName(root).namespace
+        doc_number = root.find("{{{0}}}meta/{{{0}}}docNumber".format(namespace))
+        if doc_number is not None:
+            identifier = USC_DOCUMENT_IDENTIFIER_PREFIX + doc_number.text.strip()
+    return identifier
+
+def read_document_root(xml_filepath):
+    # Namespaces and the document identifier are on the root element or in the
+    # metadata, its first child, no need to read further
+    root = None
+    for event, node in etree.iterparse(xml_filepath, events=("start", "end")):
+        if root is None:
+            root = node
+            if root.get("identifier") is not None:
+                break
+        elif event == "end" and node.getparent() is root:
+            break
+    return dict(root.nsmap), get_document_identifier(root)
+
+
+class SectionIndex(object):
+    # Byte ranges of the top level section elements of an XML file, found with
+    # one scan of its bytes, so that a section can be parsed on its own without
+    # parsing the rest of the file. Sections nested in another one (quoted in
+    # the notes) are part of their parent's range.
+    def __init__(self, xml_filepath, nsmap, document_identifier, sections):
+        self.xml_filepath = xml_filepath
+        self.nsmap = nsmap
+        self.document_identifier = document_identifier
+        # (identifier, status, start, end) in document order
+        self.sections = sections
+        self._section_positions = dict()
+        for position, section in enumerate(sections):
+            self._section_positions.setdefault(section[0], []).append(position)
+
+    @staticmethod
+    def build(xml_filepath):
+        sections = []
+        depth = 0
+        with open(xml_filepath, 'rb') as f:
+            xml = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                for match in SECTION_TAG_REGEX.finditer(xml):
+                    closing, attributes, empty = match.groups()
+                    if closing:
+                        depth -= 1
+                        if depth == 0:
+                            sections[-1][3] = match.end()
+                        continue
+                    if depth == 0:
+                        attributes = dict(ATTRIBUTE_REGEX.findall(attributes))
+                        identifier = attributes.get(b"identifier")
+                        if identifier is not None:
+                            identifier = identifier.decode("UTF-8")
+                        status = attributes.get(b"status")
+                        if status is not None:
+                            status = status.decode("UTF-8")
+                        sections.append([identifier, status, match.start(), match.end()])
+                    if not empty:
+                        depth += 1
+            finally:
+                xml.close()
+        assert depth == 0, "Unbalanced section tags in {0}".format(xml_filepath)
+        nsmap, document_identifier = read_document_root(xml_filepath)
+        return SectionIndex(xml_filepath, nsmap, document_identifier,
+                            [tuple(s) for s in sections])
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no index or if the XML changed since it was built
+        filepath = get_section_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            try:
+                data = marshal.load(f)
+            except (ValueError, EOFError, TypeError):
+                return None
+        if data.get("format") != SECTION_INDEX_FORMAT_VERSION or \
+                not corpus_snapshot.is_source_unchanged(data, xml_filepath):
+            return None
+        return SectionIndex(xml_filepath, data["nsmap"],
+                            data["document_identifier"], data["sections"])
+
+    @staticmethod
+    def load_or_build(xml_filepath):
+        index = SectionIndex.open(xml_filepath)
+        if index is None:
+            index = SectionIndex.build(xml_filepath)
+            try:
+                index.save()
+            except (IOError, OSError) as e:
+                print(u"Warning: Unable to write section index: {0}".format(e))
+        return index
+
+    def save(self):
+        data = corpus_snapshot.get_source_info(self.xml_filepath)
+        data["format"] = SECTION_INDEX_FORMAT_VERSION
+        data["nsmap"] = self.nsmap
+        data["document_identifier"] = self.document_identifier
+        data["sections"] = self.sections
+        filepath = get_section_index_filepath(self.xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_filepath, filepath)
+
+    def get_section_positions(self, identifier):
+        # Usually one, more if a section identifier is repeated in the document
+        return self._section_positions.get(identifier, [])
+
+    def _wrap(self, fragment):
+        # The section's namespaces are declared on the root element of the file
+        declarations = []
+        for prefix, uri in sorted(self.nsmap.items()):
+            if prefix is None:
+                declarations.append(b'xmlns="{0}"'.format(uri))
+            else:
+                declarations.append(b'xmlns:{0}="{1}"'.format(prefix, uri))
+        return b"<sectionIndexFragment {0}>{1}</sectionIndexFragment>".format(
+            b" ".join(declarations), fragment)
+
+    def parse_section(self, position):
+        # Element of the section at the given position, read from its byte range
+        _, _, start, end = self.sections[position]
+        with open(self.xml_filepath, 'rb') as f:
+            f.seek(start)
+            fragment = f.read(end - start)
+        return etree.fromstring(self._wrap(fragment))[0]
@@ -1,34 +1,40 @@
 import os
 from os.path import join, splitext
 import json
-from .. import irc_crawler
+from .. import parallel_corpus
 from .. import definition_extractor
-from nltk.tokenize import word_tokenize
+from ..jsonl_stream import JSONLWriter, iterate_over_records
+from ..tokenization import word_tokenize
 import numpy as np
 import math
 import matplotlib.pyplot as plt
 
 
-def dump_definitions(defined_terms_filename, definitions_filename):
-    all_definitions = dict()
-    crawler = irc_crawler.IRCCrawler()
-    for section in crawler.iterate_over_sections():
-        defined_terms, definitions = definition_extractor.extract_definitions(section)
-        if len(defined_terms) == 0:
-            continue
-        all_definitions[section.id.val] = definitions
-        with open(defined_terms_filename, 'a') as f:
-            for term in defined_terms:
+def dump_definitions(defined_terms_filename, definitions_filename, jobs=1, resume=False):
+    # One line per section with definitions, written as sections are
+    # extracted, an interrupted dump is continued with resume
+    with JSONLWriter(definitions_filename, resume=resume) as writer:
+        extracted = parallel_corpus.map_sections(
+            definition_extractor.extract_definitions, jobs=jobs, start=writer.position)
+        for section_id, (defined_terms, definitions) in extracted:
+            if len(defined_terms) > 0:
+                writer.write({
+                    "section_id": section_id,
+                    "defined_terms": defined_terms,
+                    "definitions": definitions
+                })
+            writer.checkpoint()
+    with open(defined_terms_filename, 'w') as f:
+        for record in iterate_over_records(definitions_filename):
+            for term in record["defined_terms"]:
                 f.write(u"{}\n".format(term).encode("UTF-8"))
-    with open(definitions_filename, 'w') as f:
-        json.dump(all_definitions, f, indent=4, sort_keys=True, encoding="UTF-8")
-    return all_definitions
 
-def dump_stats(all_definitions, persection_definition_stats_filename, overall_definition_stats_filename):
+def dump_stats(definitions_filename, persection_definition_stats_filename, overall_definition_stats_filename):
     overall_token_counts = []
     persection_definition_stats = dict()
-    for section_id in all_definitions:
-        definitions = all_definitions[section_id]
+    for record in iterate_over_records(definitions_filename):
+        section_id = record["section_id"]
+        definitions = record["definitions"]
         section_token_counts = []
         for defined_term in definitions:
             definition = definitions[defined_term]["sentence"]
@@ -99,19 +105,21 @@ def is_outlier(counts, cutoff):
 
 def main(args):
     # Make directory to store our output files
-    os.mkdir(args.output_dir)
+    if not (args.resume and os.path.isdir(args.output_dir)):
+        os.mkdir(args.output_dir)
     # Dump all defined terms here
     defined_terms_filename = join(args.output_dir, "defined_terms.txt")
-    # Dump all definitions here, section-id => defined-term => definition
-    definitions_filename = join(args.output_dir, "definitions.json")
+    # Dump all definitions here, one line per section: section-id, defined terms
+    # and defined-term => definition
+    definitions_filename = join(args.output_dir, "definitions.jsonl")
 
     # Dump stats here
     persection_definition_stats_filename = join(args.output_dir, "persection_definition_stats.json")
     overall_definition_stats_filename = join(args.output_dir, "overall_definition_stats.json")
 
-    all_definitions = dump_definitions(defined_terms_filename, definitions_filename)
+    dump_definitions(defined_terms_filename, definitions_filename, jobs=args.jobs, resume=args.resume)
 
-    dump_stats(all_definitions, persection_definition_stats_filename, overall_definition_stats_filename)
+    dump_stats(definitions_filename, persection_definition_stats_filename, overall_definition_stats_filename)
 
 
 if __name__ == "__main__":
@@ -126,5 +134,12 @@ if __name__ == "__main__":
     parser.add_argument("--plot-sections",
                         action="store_true",
                         help="Generate plot for each section for token counts over definitions.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes extracting definitions, results are identical for any number.")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="Continue an interrupted run in the same output directory.")
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,190 @@
+import os
+import time
+import numpy as np
+from .. import corpus_snapshot
+from .. import irc_crawler
+from .. import parallel_corpus
+from .. import definition_extractor
+from .. import rule_extractor
+from ..tokenization import word_tokenize
+
+LEVEL_TABLE_FORMAT_VERSION = 1
+# Bit of each rule type in the rule_flags column
+RULE_FLAGS = dict(
+    (rule_type, 1 << i) for i, rule_type in enumerate(rule_extractor.RULE_TYPES.values()))
+# Row of the level's section, depth, index in irc_crawler.TAGS and counts,
+# sentences, tokens, fragments and defined terms include the sublevels'
+COLUMN_TYPES = [
+    ("ids", np.unicode_),
+    ("section_rows", np.int32),
+    ("depths", np.int8),
+    ("tag_codes", np.int8),
+    ("sentence_counts", np.int32),
+    ("token_counts", np.int32),
+    ("fragment_counts", np.int32),
+    ("definition_counts", np.int32),
+    ("rule_flags", np.uint8)
+]
+
+
+def get_level_table_filepath(xml_filepath):
+    return "{0}.levelstats.npz".format(xml_filepath)
+
+def get_level_rows(section):
+    # One row per level of the section, in preorder, without section_rows.
+    # token_count is the number of tokens of the level's sentences, as in
+    # Level.get_average_tokens_per_sentence.
+    rows = []
+    for level in section.preorder_transversal():
+        sentences = level.get_sentences()
+        rows.append((level.id.val,
+                     level.id.get_depth(),
+                     irc_crawler.TAGS.index(level.tag),
+                     len(sentences),
+                     sum(len(word_tokenize(s)) for s in sentences),
+                     len(level.get_sentence_fragments()),
+                     len(definition_extractor.extract_defined_terms(level)),
+                     RULE_FLAGS.get(rule_extractor.get_rule_type(level), 0)))
+    return rows
+
+
+class LevelTable(object):
+    # Statistics of every level as NumPy columns, row i is the i-th level in
+    # document preorder. Queries are vectorized over whole columns instead of
+    # tokenizing levels again.
+    def __init__(self, columns):
+        for name, _ in COLUMN_TYPES:
+            setattr(self, name, columns[name])
+
+    def __len__(self):
+        return len(self.ids)
+
+    @staticmethod
+    def build(jobs=1, xml_filepath=irc_crawler.IRC_XML_FILEPATH):
+        rows = []
+        section_rows = []
+        for _, level_rows in parallel_corpus.map_sections(
+                get_level_rows, jobs=jobs, xml_filepath=xml_filepath):
+            section_rows.extend([len(rows)] * len(level_rows))
+            rows.extend(level_rows)
+        values = [list(column) for column in zip(*rows)]
+        if len(values) == 0:
+            values = [[] for _ in xrange(len(COLUMN_TYPES) - 1)]
+        values.insert(1, section_rows)
+        columns = dict()
+        for (name, dtype), column in zip(COLUMN_TYPES, values):
+            columns[name] = np.array(column, dtype=dtype)
+        return LevelTable(columns)
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no table or if the XML changed since it was built
+        filepath = get_level_table_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        data = np.load(filepath)
+        try:
+            source_info = dict((key, data[key].item())
+                               for key in ["format", "xml_hash", "xml_size", "xml_mtime"])
+            if source_info["format"] != LEVEL_TABLE_FORMAT_VERSION or \
+                    not corpus_snapshot.is_source_unchanged(source_info, xml_filepath):
+                return None
+            return LevelTable(dict((name, data[name]) for name, _ in COLUMN_TYPES))
+        except KeyError:
+            return None
+        finally:
+            data.close()
+
+    @staticmethod
+    def load_or_build(jobs=1, xml_filepath=irc_crawler.IRC_XML_FILEPATH):
+        table = LevelTable.open(xml_filepath)
+        if table is None:
+            table = LevelTable.build(jobs=jobs, xml_filepath=xml_filepath)
+            try:
+                table.save(xml_filepath)
+            except (IOError, OSError) as e:
+                print(u"Warning: Unable to write level table: {0}".format(e))
+        return table
+
+    def save(self, xml_filepath):
+        data = corpus_snapshot.get_source_info(xml_filepath)
+        data["format"] = LEVEL_TABLE_FORMAT_VERSION
+        for name, _ in COLUMN_TYPES:
+            data[name] = getattr(self, name)
+        filepath = get_level_table_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            np.savez(f, **data)
+        os.rename(tmp_filepath, filepath)
+
+    def get_average_tokens_per_sentence(self):
+        # Levels without sentences average 0 tokens
+        sentence_counts = self.sentence_counts.astype(np.float64)
+        averages = np.zeros(len(self))
+        np.divide(self.token_counts, sentence_counts, out=averages, where=sentence_counts > 0)
+        return averages
+
+    def get_sections_ordered_by_average_tokens_per_sentence(self):
+        # Same (section num, average) pairs and order as the function of
+        # irc_crawler, the sort is stable too
+        rows = np.flatnonzero(self.depths == 0)
+        averages = self.get_average_tokens_per_sentence()[rows]
+        order = np.argsort(averages, kind="mergesort")
+        return [(unicode(level_id[1:]), float(average))
+                for level_id, average in zip(self.ids[rows[order]], averages[order])]
+
+    def find_levels(self, min_depth=None, min_token_count=None, tag=None, rule_type=None):
+        # Ids of the levels matching all of the given conditions, minimums
+        # included, in document order. E.g. levels deeper than 4 with more than
+        # 200 tokens: find_levels(min_depth=5, min_token_count=201)
+        mask = np.ones(len(self), dtype=bool)
+        if min_depth is not None:
+            mask &= self.depths >= min_depth
+        if min_token_count is not None:
+            mask &= self.token_counts >= min_token_count
+        if tag is not None:
+            mask &= self.tag_codes == irc_crawler.TAGS.index(tag)
+        if rule_type is not None:
+            mask &= (self.rule_flags & RULE_FLAGS[rule_type]) != 0
+        return [unicode(level_id) for level_id in self.ids[mask]]
+
+
+def main(args):
+    start = time.time()
+    if args.rebuild:
+        table = LevelTable.build(jobs=args.jobs)
+        table.save(irc_crawler.IRC_XML_FILEPATH)
+    else:
+        table = LevelTable.load_or_build(jobs=args.jobs)
+    print("Loaded {0} levels in {1:.3f}s".format(len(table), time.time() - start))
+
+    start = time.time()
+    sections = table.get_sections_ordered_by_average_tokens_per_sentence()
+    print("Sections by average tokens per sentence in {0:.3f}s, last 10:".format(time.time() - start))
+    for section_num, average in sections[-10:]:
+        print(u"    {0}: {1:.2f}".format(section_num, average))
+
+    start = time.time()
+    level_ids = table.find_levels(min_depth=args.min_depth, min_token_count=args.min_token_count)
+    print("{0} levels at depth >= {1} with >= {2} tokens in {3:.3f}s".format(
+        len(level_ids), args.min_depth, args.min_token_count, time.time() - start))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Build and query the table of per-level stats of the Internal Revenue Code.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes computing the stats when the table is built.")
+    parser.add_argument("--rebuild",
+                        action="store_true",
+                        help="Build the table even if it is up to date.")
+    parser.add_argument("--min-depth",
+                        type=int,
+                        default=5)
+    parser.add_argument("--min-token-count",
+                        type=int,
+                        default=201)
+    args = parser.parse_args()
+    main(args)
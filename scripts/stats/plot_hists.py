@@ -1,4 +1,5 @@
 import json
+from ..jsonl_stream import iterate_over_records
 import numpy as np
 import math
 import matplotlib.pyplot as plt
@@ -55,9 +56,6 @@ def is_outlier(counts, cutoff):
     return np.array([c > cutoff for c in counts])
 
 def main():
-    with open("semparsing_stats.json", 'r') as f:
-        semparsing_stats = json.load(f)
-
     with open("definition_stats/overall_definition_stats.json", 'r') as f:
         overall_definition_stats = json.load(f)
 
@@ -65,20 +63,18 @@ def main():
         overall_rule_stats = json.load(f)
 
     definition_crash_counts = []
-    for section_id in semparsing_stats["definitions"]:
-        token_counts = semparsing_stats["definitions"][section_id]
-        definition_crash_counts.extend(token_counts)
-
     rule_crash_counts = {
         "general-rule": [],
         "exceptions": [],
         "special-rules": []
     }
-    
-    for rule_type in semparsing_stats["rules"]:
-        for section_id in semparsing_stats["rules"][rule_type]:
-            token_counts = semparsing_stats["rules"][rule_type][section_id]
-            rule_crash_counts[rule_type].extend(token_counts)
+
+    # Output of semparsing_stats, one line per section and kind
+    for record in iterate_over_records("semparsing_stats.jsonl"):
+        if record["kind"] == "definitions":
+            definition_crash_counts.extend(record["token_counts"])
+        else:
+            rule_crash_counts[record["rule_type"]].extend(record["token_counts"])
 
     plot_definition_hist(
         overall_definition_stats["counts"],
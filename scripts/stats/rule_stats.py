@@ -1,27 +1,27 @@
 import os
 from os.path import join, splitext
 import json
-from .. import irc_crawler
-from .. import rule_extractor
-from nltk.tokenize import word_tokenize
+from ..heading_index import HeadingIndex
+from ..jsonl_stream import JSONLWriter, iterate_over_records
+from ..tokenization import word_tokenize
 import numpy as np
 import math
 import matplotlib.pyplot as plt
 
 
-def dump_rules(rules_filename):
-    all_rules = dict()
-    crawler = irc_crawler.IRCCrawler()
-    for section in crawler.iterate_over_sections():
-        rules = rule_extractor.extract_rules(section)
-        if len(rules) == 0:
-            continue
-        all_rules[section.id.val] = rules
-    with open(rules_filename, 'w') as f:
-        json.dump(all_rules, f, indent=4, sort_keys=True, encoding="UTF-8")
-    return all_rules
+def dump_rules(rules_filename, jobs=1, resume=False):
+    # One line per section with rules, an interrupted dump is continued with
+    # resume. Rules are read from the heading index, which is built with jobs
+    # processes if needed.
+    index = HeadingIndex.load_or_build(jobs=jobs)
+    with JSONLWriter(rules_filename, resume=resume) as writer:
+        for section_id in index.section_ids[writer.position:]:
+            rules = index.extract_rules(section_id)
+            if len(rules) > 0:
+                writer.write({"section_id": section_id, "rules": rules})
+            writer.checkpoint()
 
-def dump_stats(all_rules, persection_rule_stats_filename, overall_rule_stats_filename):
+def dump_stats(rules_filename, persection_rule_stats_filename, overall_rule_stats_filename):
     overall_token_counts = {
         "general-rule": [],
         "exceptions": [],
@@ -29,8 +29,9 @@ def dump_stats(all_rules, persection_rule_stats_filename, overall_rule_stats_fil
     }
     persection_rule_stats = dict()
     basename = splitext(persection_rule_stats_filename)[0]
-    for section_id in all_rules:
-        rules = all_rules[section_id]
+    for record in iterate_over_records(rules_filename):
+        section_id = record["section_id"]
+        rules = record["rules"]
         section_token_counts = {
             "general-rule": [],
             "exceptions": [],
@@ -122,17 +123,19 @@ def calc_stats(counts):
 
 def main(args):
     # Make directory to store our output files
-    os.mkdir(args.output_dir)
-    # Dump all rules here, level-id => general-rule/exceptions/special-rules => rule
-    rules_filename = join(args.output_dir, "rules.json")
+    if not (args.resume and os.path.isdir(args.output_dir)):
+        os.mkdir(args.output_dir)
+    # Dump all rules here, one line per section: section-id and
+    # level-id => general-rule/exceptions/special-rules => rule
+    rules_filename = join(args.output_dir, "rules.jsonl")
 
     # Dump stats here
     persection_rule_stats_filename = join(args.output_dir, "persection_rule_stats.json")
     overall_rule_stats_filename = join(args.output_dir, "overall_rule_stats.json")
 
-    all_rules = dump_rules(rules_filename)
+    dump_rules(rules_filename, jobs=args.jobs, resume=args.resume)
 
-    dump_stats(all_rules, persection_rule_stats_filename, overall_rule_stats_filename)
+    dump_stats(rules_filename, persection_rule_stats_filename, overall_rule_stats_filename)
 
 
 if __name__ == "__main__":
@@ -147,5 +150,12 @@ if __name__ == "__main__":
     parser.add_argument("--plot-sections",
                         action="store_true",
                         help="Generate plot for each section for token counts over rules.")
+    parser.add_argument("--jobs",
+                        type=int,
+                        default=1,
+                        help="Number of processes extracting rules, results are identical for any number.")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="Continue an interrupted run in the same output directory.")
     args = parser.parse_args()
     main(args)
@@ -1,69 +1,72 @@
-import json
+import itertools
 from .. import candc_boxer_api
-from nltk.tokenize import word_tokenize
+from ..jsonl_stream import JSONLWriter, iterate_over_records
+from ..tokenization import word_tokenize
 
 
-def count_definition_crashes(ccboxer, definitions):
-    crashed_token_counts = dict()
+RULE_TYPES = ["general-rule", "exceptions", "special-rules"]
+
+
+def get_definition_sentences(record):
+    # (output record, sentences) of a section of the definitions dump
+    section_definitions = record["definitions"]
+    sentences = [section_definitions[term]["sentence"] for term in section_definitions]
+    return [({
+        "kind": "definitions",
+        "section_id": record["section_id"]
+    }, sentences)]
+
+def get_rule_sentences(record):
+    # (output record, sentences) of a section of the rules dump, one per rule
+    # type
+    section_rules = {
+        "general-rule": [],
+        "exceptions": [],
+        "special-rules": []
+    }
+    for level_id in record["rules"]:
+        level_rules = record["rules"][level_id]
+        for rule_type in level_rules:
+            section_rules[rule_type].extend(level_rules[rule_type])
+    return [({
+        "kind": "rules",
+        "section_id": record["section_id"],
+        "rule_type": rule_type
+    }, section_rules[rule_type]) for rule_type in RULE_TYPES]
+
+def print_definition_totals(crash_records):
+    total_num_sections = 0
     total_section_crash_count = 0
     total_num_definitions = 0
     total_num_crashes = 0
-    for section_id in definitions:
-        section_definitions = definitions[section_id]
-        sentences = [section_definitions[term]["sentence"] for term in section_definitions]
-        token_counts = count_crashes(ccboxer, sentences)
-        crashed_token_counts[section_id] = token_counts
-        if len(token_counts) > 0:
+    for record in crash_records:
+        if record["kind"] != "definitions":
+            continue
+        total_num_sections += 1
+        if len(record["token_counts"]) > 0:
             total_section_crash_count += 1
-        total_num_crashes += len(token_counts)
-        total_num_definitions += len(sentences)
-    print("Total number of sections with definitions: {}".format(len(definitions)))
+        total_num_crashes += len(record["token_counts"])
+        total_num_definitions += record["num_sentences"]
+    print("Total number of sections with definitions: {}".format(total_num_sections))
     print("Total number of sections with crashes for definitions: {}".format(total_section_crash_count))
     print("Total number of definitions: {}".format(total_num_definitions))
     print("Total number of definitions that cause C&C/Boxer crash: {}".format(total_num_crashes))
-    return crashed_token_counts
 
-def count_rule_crashes(ccboxer, rules):
-    crashed_token_counts = {
-        "general-rule": dict(),
-        "exceptions": dict(),
-        "special-rules": dict()
-    }
-    total_num_rules = {
-        "general-rule": 0,
-        "exceptions": 0,
-        "special-rules": 0
-    }
-    total_num_crashes = {
-        "general-rule": 0,
-        "exceptions": 0,
-        "special-rules": 0
-    }
-    total_section_crash_count = {
-        "general-rule": {"total": 0, "crash": 0},
-        "exceptions": {"total": 0, "crash": 0},
-        "special-rules": {"total": 0, "crash": 0}
-    }
-    for section_id in rules:
-        section_rules = {
-            "general-rule": [],
-            "exceptions": [],
-            "special-rules": []
-        }
-        for level_id in rules[section_id]:
-            level_rules = rules[section_id][level_id]
-            for rule_type in level_rules:
-                section_rules[rule_type].extend(level_rules[rule_type])
-        for rule_type in section_rules:
-            sentences = section_rules[rule_type]
-            token_counts = count_crashes(ccboxer, sentences)
-            crashed_token_counts[rule_type][section_id] = token_counts
-            if len(sentences) > 0:
-                total_section_crash_count[rule_type]["total"] += 1
-            if len(token_counts) > 0:
-                total_section_crash_count[rule_type]["crash"] += 1
-            total_num_crashes[rule_type] += len(token_counts)
-            total_num_rules[rule_type] += len(sentences)
+def print_rule_totals(crash_records):
+    total_num_rules = dict((rule_type, 0) for rule_type in RULE_TYPES)
+    total_num_crashes = dict((rule_type, 0) for rule_type in RULE_TYPES)
+    total_section_crash_count = dict(
+        (rule_type, {"total": 0, "crash": 0}) for rule_type in RULE_TYPES)
+    for record in crash_records:
+        if record["kind"] != "rules":
+            continue
+        rule_type = record["rule_type"]
+        if record["num_sentences"] > 0:
+            total_section_crash_count[rule_type]["total"] += 1
+        if len(record["token_counts"]) > 0:
+            total_section_crash_count[rule_type]["crash"] += 1
+        total_num_crashes[rule_type] += len(record["token_counts"])
+        total_num_rules[rule_type] += record["num_sentences"]
     for rule_type in total_num_rules:
         print("Total number of sections with rules of type {}: {}".format(rule_type, total_section_crash_count[rule_type]["total"]))
         print("Total number of sections with crashes for rules of type {}: {}".format(rule_type, total_section_crash_count[rule_type]["crash"]))
@@ -71,35 +74,61 @@ def count_rule_crashes(ccboxer, rules):
         print("Total number of rules of type {} that cause C&C/Boxer crash: {}".format(rule_type, total_num_crashes[rule_type]))
     print("Total number of rules: {}".format(sum(total_num_rules.values())))
     print("Total number of rules that cause C&C/Boxer crash: {}".format(sum(total_num_crashes.values())))
-    return crashed_token_counts
 
-def count_crashes(ccboxer, sentences):
-    crashed_token_counts = []
-    for sentence in sentences:
-        try:
-            ccboxer.interpret([sentence])
-        except candc_boxer_api.CCBoxerAPIException:
-            crashed_token_counts.append(len(word_tokenize(sentence)))
-    return crashed_token_counts
+def count_crashes(ccboxer, sections, concurrency):
+    # Output records of each of the sections. The sentences of all the
+    # sections are interpreted together, so that requests are in flight
+    # concurrently even for sections with few sentences.
+    sentences = [sentence for section in sections for _, group in section for sentence in group]
+    results = iter(ccboxer.interpret_many(sentences, concurrency=concurrency))
+    section_crash_records = []
+    for section in sections:
+        crash_records = []
+        for crash_record, group in section:
+            crashed_token_counts = []
+            for sentence in group:
+                if isinstance(next(results), candc_boxer_api.CCBoxerAPIException):
+                    crashed_token_counts.append(len(word_tokenize(sentence)))
+            crash_record = dict(crash_record)
+            crash_record["num_sentences"] = len(group)
+            crash_record["token_counts"] = crashed_token_counts
+            crash_records.append(crash_record)
+        section_crash_records.append(crash_records)
+    return section_crash_records
 
 def main(args):
-    ccboxer = candc_boxer_api.CCBoxerAPI()
-    all_crashed_token_counts = dict()
+    ccboxer = candc_boxer_api.CCBoxerAPI(pool_size=args.concurrency)
 
-    with open(args.definitions_filepath, 'r') as f:
-        definitions = json.load(f)
+    # Sections of both dumps, read as they are processed
+    sections = itertools.chain(
+        (get_definition_sentences(record) for record in iterate_over_records(args.definitions_filepath)),
+        (get_rule_sentences(record) for record in iterate_over_records(args.rules_filepath)))
 
-    with open(args.rules_filepath, 'r') as f:
-        rules = json.load(f)
+    # One line per section and kind (and rule type), an interrupted run is
+    # continued with resume. Sections are sent in batches of concurrency
+    # sections, with a checkpoint after each section.
+    with JSONLWriter(args.output_file, resume=args.resume) as writer:
+        sections = itertools.islice(sections, writer.position, None)
+        while True:
+            batch = list(itertools.islice(sections, args.concurrency))
+            if len(batch) == 0:
+                break
+            for crash_records in count_crashes(ccboxer, batch, args.concurrency):
+                for crash_record in crash_records:
+                    writer.write(crash_record)
+                writer.checkpoint()
 
-    all_crashed_token_counts["definitions"] = count_definition_crashes(ccboxer, definitions)
+    print_definition_totals(iterate_over_records(args.output_file))
 
     print("*"*25)
 
-    all_crashed_token_counts["rules"] = count_rule_crashes(ccboxer, rules)
+    print_rule_totals(iterate_over_records(args.output_file))
+
+    print("*"*25)
 
-    with open(args.output_file, 'w') as f:
-        json.dump(all_crashed_token_counts, f, indent=4, sort_keys=True, encoding="UTF-8")
+    cache_stats = ccboxer.cache.get_stats()
+    print("Parse cache: {} hits, {} known crashes, {} misses".format(
+        cache_stats["hits"], cache_stats["negative_hits"], cache_stats["misses"]))
 
 
 if __name__ == "__main__":
@@ -108,12 +137,19 @@ if __name__ == "__main__":
                                                  "that cause C&C/Boxer pipeline to crash.")
     parser.add_argument("--output-file",
                         type=str,
-                        default="semparsing_stats.json")
+                        default="semparsing_stats.jsonl")
     parser.add_argument("--definitions-filepath",
                         type=str,
-                        default="definition_stats/definitions.json")
+                        default="definition_stats/definitions.jsonl")
     parser.add_argument("--rules-filepath",
                         type=str,
-                        default="rule_stats/rules.json")
+                        default="rule_stats/rules.jsonl")
+    parser.add_argument("--resume",
+                        action="store_true",
+                        help="Continue an interrupted run with the same output file.")
+    parser.add_argument("--concurrency",
+                        type=int,
+                        default=candc_boxer_api.DEFAULT_CONCURRENCY,
+                        help="Number of sentences sent to C&C/Boxer at once.")
     args = parser.parse_args()
     main(args)
\ No newline at end of file
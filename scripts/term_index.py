@@ -0,0 +1,149 @@
+# This Python file uses the following encoding: UTF-8
+import os
+import marshal
+from collections import Counter, OrderedDict
+import corpus_snapshot
+from definition_extractor import extract_defined_terms, find_defined_terms
+from text_index import get_level_texts
+
+TERM_INDEX_FORMAT_VERSION = 2
+
+
+def get_term_index_filepath(xml_filepath):
+    return "{0}.termindex".format(xml_filepath)
+
+def get_section_terms(section):
+    # Defined terms of the section, as extract_defined_terms finds them, and
+    # (level id, term) of each definition in the own texts of a level
+    defining_levels = []
+    for level in section.preorder_transversal():
+        for text in get_level_texts(level):
+            for term in find_defined_terms(text):
+                defining_levels.append((level.id.val, term))
+    return extract_defined_terms(section), defining_levels
+
+
+class DefinedTermIndex(object):
+    # term => ids of the levels defining it, number of definitions in the whole
+    # corpus and number of definitions per section. The terms of each section
+    # are kept with its content hash, so that when the XML changes only the
+    # sections whose content changed are extracted again.
+    def __init__(self, sections):
+        # (section id, content hash, defined terms, defining levels) in document order
+        self.sections = sections
+        self._counts = Counter()
+        self._section_counts = dict()
+        self._defining_levels = dict()
+        for section_id, _, defined_terms, defining_levels in sections:
+            for term in defined_terms:
+                self._counts[term] += 1
+                section_counts = self._section_counts.setdefault(term, OrderedDict())
+                section_counts[section_id] = section_counts.get(section_id, 0) + 1
+            for level_id, term in defining_levels:
+                levels = self._defining_levels.setdefault(term, [])
+                # The definitions of a level are listed together
+                if len(levels) == 0 or levels[-1] != level_id:
+                    levels.append(level_id)
+
+    @staticmethod
+    def build(crawler, previous_sections=[]):
+        # previous_sections are the sections of an index of an older XML, only
+        # sections that are not among them are extracted. The content hash
+        # covers the ids of all levels of the section, so the defining levels
+        # of a reused section are still its level ids.
+        previous_terms = dict()
+        for section_id, content_hash, defined_terms, defining_levels in previous_sections:
+            previous_terms[(section_id, content_hash)] = (defined_terms, defining_levels)
+        sections = []
+        for section in crawler.iterate_over_sections():
+            section_id = section.id.get_section_id()
+            content_hash = section.get_content_hash()
+            terms = previous_terms.get((section_id, content_hash))
+            if terms is None:
+                terms = get_section_terms(section)
+            sections.append((section_id, content_hash, terms[0], terms[1]))
+        return DefinedTermIndex(sections)
+
+    @staticmethod
+    def _load(xml_filepath):
+        filepath = get_term_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            try:
+                data = marshal.load(f)
+            except (ValueError, EOFError, TypeError):
+                return None
+        if data.get("format") != TERM_INDEX_FORMAT_VERSION:
+            return None
+        return data
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no index or if the XML changed since it was built
+        data = DefinedTermIndex._load(xml_filepath)
+        if data is None or not corpus_snapshot.is_source_unchanged(data, xml_filepath):
+            return None
+        return DefinedTermIndex(data["sections"])
+
+    @staticmethod
+    def load_or_build(crawler):
+        # An index of an older XML is updated instead of built from scratch
+        data = DefinedTermIndex._load(crawler.xml_filepath)
+        if data is not None and corpus_snapshot.is_source_unchanged(data, crawler.xml_filepath):
+            return DefinedTermIndex(data["sections"])
+        previous_sections = [] if data is None else data["sections"]
+        index = DefinedTermIndex.build(crawler, previous_sections=previous_sections)
+        try:
+            index.save(crawler.xml_filepath)
+        except (IOError, OSError) as e:
+            print(u"Warning: Unable to write term index: {0}".format(e))
+        return index
+
+    def save(self, xml_filepath):
+        data = corpus_snapshot.get_source_info(xml_filepath)
+        data["format"] = TERM_INDEX_FORMAT_VERSION
+        data["sections"] = self.sections
+        filepath = get_term_index_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_filepath, filepath)
+
+    def __contains__(self, term):
+        return term in self._counts
+
+    def terms(self):
+        return self._counts.keys()
+
+    def get_count(self, term):
+        # Number of definitions of the term in the whole corpus
+        return self._counts.get(term, 0)
+
+    def get_section_counts(self, term):
+        # Section id => number of definitions of the term, in document order
+        return self._section_counts.get(term, OrderedDict())
+
+    def get_defining_levels(self, term):
+        # Ids of the levels whose own texts define the term, in document order
+        return self._defining_levels.get(term, [])
+
+
+def main(args):
+    from irc_crawler import IRCCrawler
+    index = DefinedTermIndex.load_or_build(IRCCrawler())
+    print(u"Definitions: {0}".format(index.get_count(args.term)))
+    for section_id, count in index.get_section_counts(args.term).items():
+        print(u"    {0}: {1}".format(section_id, count))
+    print(u"Defined in: {0}".format(u", ".join(index.get_defining_levels(args.term))))
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Look up where a term is defined in the Internal Revenue Code.")
+    parser.add_argument("term",
+                        type=str,
+                        help="Defined term, e.g. 'taxable year'.")
+    args = parser.parse_args()
+    args.term = args.term.decode("UTF-8")
+    main(args)
@@ -0,0 +1,239 @@
+# This Python file uses the following encoding: UTF-8
+import os
+import re
+import marshal
+from array import array
+from bisect import bisect_left
+import corpus_snapshot
+
+TEXT_INDEX_FORMAT_VERSION = 1
+TOKEN_REGEX = re.compile(ur"\w+", re.UNICODE)
+QUERY_TOKEN_REGEX = re.compile(ur'"[^"]*"|\(|\)|[^\s()"]+', re.UNICODE)
+OPERATORS = ["AND", "OR", "NOT"]
+
+
+def get_text_index_filepath(xml_filepath):
+    return "{0}.textindex".format(xml_filepath)
+
+def normalize(text):
+    return TOKEN_REGEX.findall(text.lower())
+
+def get_level_texts(level):
+    # Texts that belong to the level itself and not to one of its sublevels,
+    # continuations sandwiched between sublevels included
+    texts = [level.heading, level.chapeau, level.content]
+    texts.extend(c[1] for c in level.sublevels.values())
+    texts.append(level.continuation)
+    return [t for t in texts if t is not None]
+
+
+class TextIndex(object):
+    # Inverted index from normalized tokens to the levels whose own texts contain
+    # them. Levels are numbered in preorder, so the levels under a scope are the
+    # contiguous range [scope, subtree_ends[scope]). Each token has two parallel
+    # arrays of level numbers and token positions, sorted by level.
+    def __init__(self, level_ids, subtree_ends, postings):
+        self.level_ids = level_ids
+        self.subtree_ends = subtree_ends
+        self._postings = postings
+        self._level_numbers = dict()
+        for level_number, level_id in enumerate(level_ids):
+            self._level_numbers.setdefault(level_id, level_number)
+
+    @staticmethod
+    def build(crawler):
+        level_ids = []
+        subtree_ends = array('i')
+        postings = dict()
+
+        def add_level(level):
+            level_number = len(level_ids)
+            level_ids.append(level.id.val)
+            subtree_ends.append(0)
+            position = 0
+            for text in get_level_texts(level):
+                for token in normalize(text):
+                    if token not in postings:
+                        postings[token] = (array('i'), array('i'))
+                    postings[token][0].append(level_number)
+                    postings[token][1].append(position)
+                    position += 1
+                # Gap between texts, so that phrases never span two of them
+                position += 1
+            for c in level.sublevels.values():
+                add_level(c[0])
+            subtree_ends[level_number] = len(level_ids)
+
+        for section in crawler.iterate_over_sections():
+            add_level(section)
+        return TextIndex(level_ids, subtree_ends, postings)
+
+    @staticmethod
+    def open(xml_filepath):
+        # Returns None if there is no index or if the XML changed since it was built
+        filepath = get_text_index_filepath(xml_filepath)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'rb') as f:
+            try:
+                data = marshal.load(f)
+            except (ValueError, EOFError, TypeError):
+                return None
+        if data.get("format") != TEXT_INDEX_FORMAT_VERSION or \
+                not corpus_snapshot.is_source_unchanged(data, xml_filepath):
+            return None
+        subtree_ends = array('i')
+        subtree_ends.fromstring(data["subtree_ends"])
+        # Posting arrays are only decoded when a query needs them
+        return TextIndex(data["level_ids"], subtree_ends, data["postings"])
+
+    @staticmethod
+    def load_or_build(crawler):
+        index = TextIndex.open(crawler.xml_filepath)
+        if index is None:
+            index = TextIndex.build(crawler)
+            try:
+                index.save(crawler.xml_filepath)
+            except (IOError, OSError) as e:
+                print(u"Warning: Unable to write text index: {0}".format(e))
+        return index
+
+    def save(self, xml_filepath):
+        data = corpus_snapshot.get_source_info(xml_filepath)
+        data["format"] = TEXT_INDEX_FORMAT_VERSION
+        data["level_ids"] = self.level_ids
+        data["subtree_ends"] = self.subtree_ends.tostring()
+        data["postings"] = dict()
+        for token in self._postings:
+            levels, positions = self._get_posting(token)
+            data["postings"][token] = (levels.tostring(), positions.tostring())
+        filepath = get_text_index_filepath(xml_filepath)
+        tmp_filepath = "{0}.tmp{1}".format(filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            marshal.dump(data, f)
+        os.rename(tmp_filepath, filepath)
+
+    def _get_posting(self, token):
+        posting = self._postings.get(token)
+        if posting is None:
+            return array('i'), array('i')
+        if isinstance(posting[0], bytes):
+            # Loaded from disk, still the arrays' bytes
+            levels, positions = array('i'), array('i')
+            levels.fromstring(posting[0])
+            positions.fromstring(posting[1])
+            posting = (levels, positions)
+            self._postings[token] = posting
+        return posting
+
+    def get_scope(self, scope_level_id=None):
+        # Range of level numbers at or below the scope level
+        if scope_level_id is None:
+            return 0, len(self.level_ids)
+        scope_level_id = unicode(scope_level_id)
+        if scope_level_id not in self._level_numbers:
+            return 0, 0
+        start = self._level_numbers[scope_level_id]
+        return start, self.subtree_ends[start]
+
+    def _scoped_posting(self, token, scope):
+        levels, positions = self._get_posting(token)
+        lo = bisect_left(levels, scope[0])
+        hi = bisect_left(levels, scope[1])
+        return levels[lo:hi], positions[lo:hi]
+
+    def _find_term(self, token, scope):
+        return set(self._scoped_posting(token, scope)[0])
+
+    def _find_phrase(self, tokens, scope):
+        if len(tokens) == 0:
+            return set()
+        if len(tokens) == 1:
+            return self._find_term(tokens[0], scope)
+        postings = [self._scoped_posting(t, scope) for t in tokens]
+        # Start from the rarest token, keyed by where the phrase would start
+        offsets = sorted(range(len(tokens)), key=lambda i: len(postings[i][0]))
+        starts = None
+        for offset in offsets:
+            levels, positions = postings[offset]
+            token_starts = set(zip(levels, [p - offset for p in positions]))
+            starts = token_starts if starts is None else starts & token_starts
+            if len(starts) == 0:
+                break
+        return set(level for level, _ in starts)
+
+    def _parse_query(self, query):
+        tokens = QUERY_TOKEN_REGEX.findall(query)
+        tokens.reverse()
+        return tokens
+
+    def _evaluate_or(self, tokens, scope):
+        result = self._evaluate_and(tokens, scope)
+        while len(tokens) > 0 and tokens[-1] == "OR":
+            tokens.pop()
+            result = result | self._evaluate_and(tokens, scope)
+        return result
+
+    def _evaluate_and(self, tokens, scope):
+        result = self._evaluate_not(tokens, scope)
+        while len(tokens) > 0 and tokens[-1] not in ["OR", ")"]:
+            if tokens[-1] == "AND":
+                tokens.pop()
+            result = result & self._evaluate_not(tokens, scope)
+        return result
+
+    def _evaluate_not(self, tokens, scope):
+        if len(tokens) > 0 and tokens[-1] == "NOT":
+            tokens.pop()
+            return set(xrange(scope[0], scope[1])) - self._evaluate_not(tokens, scope)
+        return self._evaluate_atom(tokens, scope)
+
+    def _evaluate_atom(self, tokens, scope):
+        assert len(tokens) > 0, "Unexpected end of query."
+        token = tokens.pop()
+        if token == "(":
+            result = self._evaluate_or(tokens, scope)
+            assert len(tokens) > 0 and tokens.pop() == ")", "Unbalanced parentheses in query."
+            return result
+        assert token not in OPERATORS + [")"], u"Unexpected {0} in query.".format(token)
+        if token.startswith(u'"'):
+            token = token[1:-1]
+        # Words that normalize to many tokens, e.g. "tax-exempt", are phrases too
+        return self._find_phrase(normalize(token), scope)
+
+    def search(self, query, scope_level_id=None):
+        # query is a boolean combination of words and "quoted phrases" with AND
+        # (implicit between terms), OR, NOT and parentheses. Returns the ids of the
+        # matching levels at or below the scope level, in document order.
+        scope = self.get_scope(scope_level_id)
+        tokens = self._parse_query(query)
+        result = self._evaluate_or(tokens, scope)
+        assert len(tokens) == 0, u"Unexpected {0} in query.".format(tokens[-1])
+        return [self.level_ids[level_number] for level_number in sorted(result)]
+
+    def search_phrase(self, text, scope_level_id=None):
+        scope = self.get_scope(scope_level_id)
+        result = self._find_phrase(normalize(text), scope)
+        return [self.level_ids[level_number] for level_number in sorted(result)]
+
+
+def main(args):
+    from irc_crawler import IRCCrawler
+    index = TextIndex.load_or_build(IRCCrawler())
+    for level_id in index.search(args.query, scope_level_id=args.level_id):
+        print(level_id)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Search the text of the Internal Revenue Code.")
+    parser.add_argument("query",
+                        type=str,
+                        help="Words and \"quoted phrases\" combined with AND, OR, NOT and parentheses.")
+    parser.add_argument("--level-id",
+                        type=str,
+                        default=None,
+                        help="Only search at or below this level, e.g. 's163/h'.")
+    args = parser.parse_args()
+    args.query = args.query.decode("UTF-8")
+    main(args)
@@ -0,0 +1,149 @@
+import os
+import atexit
+import hashlib
+import marshal
+from collections import OrderedDict
+import nltk
+from nltk.tokenize import TreebankWordTokenizer
+
+PUNKT_RESOURCE = "tokenizers/punkt/english.pickle"
+# Set to a file path to keep the token cache across runs
+TOKEN_CACHE_FILEPATH_ENVVAR = "IRC_TOKEN_CACHE"
+# Texts kept by each cache, enough for the fragments shared by the levels of
+# a section and its neighbours
+DEFAULT_MAX_ENTRIES = 20000
+
+
+def _text_key(text):
+    if isinstance(text, unicode):
+        text = text.encode("UTF-8")
+    return hashlib.sha1(text).digest()
+
+
+class TokenizationService(object):
+    # Sentence and word tokenization with a preloaded punkt model, and caches
+    # keyed by content hash, so the same text is only tokenized once no matter
+    # how many levels contain it. Each cache keeps the max_entries most
+    # recently used texts, so a corpus-wide run does not keep every text.
+    def __init__(self, cache_filepath=None, max_entries=DEFAULT_MAX_ENTRIES):
+        self.cache_filepath = cache_filepath
+        self.max_entries = max_entries
+        self._sentence_tokenizer = None
+        self._word_tokenizer = TreebankWordTokenizer()
+        # Content hash => list of sentences, and content hash => list of
+        # tokens, least recently used first
+        self._sentences = OrderedDict()
+        self._words = OrderedDict()
+        # One hit or miss per call of sent_tokenize or word_tokenize
+        self.hits = 0
+        self.misses = 0
+        if cache_filepath is not None and os.path.exists(cache_filepath):
+            self._sentences, self._words = self._load()
+
+    def _load(self):
+        with open(self.cache_filepath, 'rb') as f:
+            sentences, words = marshal.load(f)
+        # Older cache files are plain dicts
+        if isinstance(sentences, dict):
+            sentences, words = sentences.items(), words.items()
+        return (OrderedDict(sentences[-self.max_entries:]),
+                OrderedDict(words[-self.max_entries:]))
+
+    def _get(self, cache, key):
+        value = cache.pop(key, None)
+        if value is not None:
+            cache[key] = value
+        return value
+
+    def _put(self, cache, key, value):
+        cache[key] = value
+        if len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+    def _get_sentence_tokenizer(self):
+        if self._sentence_tokenizer is None:
+            self._sentence_tokenizer = nltk.data.load(PUNKT_RESOURCE)
+        return self._sentence_tokenizer
+
+    def _tokenize_sentences(self, key, text):
+        sentences = self._get_sentence_tokenizer().tokenize(text)
+        self._put(self._sentences, key, sentences)
+        return sentences
+
+    def sent_tokenize(self, text):
+        key = _text_key(text)
+        sentences = self._get(self._sentences, key)
+        if sentences is None:
+            self.misses += 1
+            sentences = self._tokenize_sentences(key, text)
+        else:
+            self.hits += 1
+        return list(sentences)
+
+    def word_tokenize(self, text):
+        # Same as nltk's word_tokenize: treebank tokens of each punkt sentence
+        key = _text_key(text)
+        words = self._get(self._words, key)
+        if words is None:
+            self.misses += 1
+            sentences = self._get(self._sentences, key)
+            if sentences is None:
+                sentences = self._tokenize_sentences(key, text)
+            words = []
+            for sentence in sentences:
+                words.extend(self._word_tokenizer.tokenize(sentence))
+            self._put(self._words, key, words)
+        else:
+            self.hits += 1
+        return list(words)
+
+    def count_tokens(self, text):
+        return len(self.word_tokenize(text))
+
+    def get_sentences_for_levels(self, levels):
+        return [level.get_sentences(sentence_tokenizer=self.sent_tokenize) for level in levels]
+
+    def get_token_counts_for_levels(self, levels):
+        # One tokenization per unique fragment, shared by a level and its ancestors
+        return [
+            sum(self.count_tokens(f) for f in level.get_sentence_fragments())
+            for level in levels
+        ]
+
+    def save(self):
+        # Merges with what other runs saved meanwhile, this run's texts being
+        # the most recently used, and keeps max_entries of each. The rename
+        # keeps the file readable at all times.
+        if self.cache_filepath is None:
+            return
+        if os.path.exists(self.cache_filepath):
+            sentences, words = self._load()
+            for cache, saved_cache in [(self._sentences, sentences), (self._words, words)]:
+                for key, value in cache.items():
+                    saved_cache.pop(key, None)
+                    self._put(saved_cache, key, value)
+            self._sentences, self._words = sentences, words
+        tmp_filepath = "{0}.tmp{1}".format(self.cache_filepath, os.getpid())
+        with open(tmp_filepath, 'wb') as f:
+            # marshal only writes plain dicts and lists
+            marshal.dump((self._sentences.items(), self._words.items()), f)
+        os.rename(tmp_filepath, self.cache_filepath)
+
+
+_default_service = None
+
+
+def get_default_service():
+    global _default_service
+    if _default_service is None:
+        cache_filepath = os.environ.get(TOKEN_CACHE_FILEPATH_ENVVAR)
+        _default_service = TokenizationService(cache_filepath=cache_filepath)
+        if cache_filepath is not None:
+            atexit.register(_default_service.save)
+    return _default_service
+
+def sent_tokenize(text):
+    return get_default_service().sent_tokenize(text)
+
+def word_tokenize(text):
+    return get_default_service().word_tokenize(text)